@@ -0,0 +1,60 @@
+"""
+Profile a generated CSV with modules.csv_profile and report time and peak memory.
+
+    python benchmarks/csv_profile_bench.py [rows ...]
+
+Defaults to 100,000 and 1,000,000 rows. Peak memory is what tracemalloc
+sees allocated while profiling, so it is comparable across platforms; it
+should stay roughly flat as the row count grows, because rows are read in
+chunks and only per-column running statistics are kept.
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.csv_profile import profile_csv
+
+CITIES = ["Delhi", "Mumbai", "Pune", "Chennai", "Kolkata", "Jaipur"]
+
+
+def write_csv(path, rows, seed=3):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "date", "city", "amount", "qty", "active", "note"])
+        for i in range(rows):
+            writer.writerow([
+                i,
+                f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                rng.choice(CITIES),
+                f"{rng.gauss(250, 80):.2f}",
+                rng.randint(1, 20),
+                rng.choice(["true", "false"]),
+                "" if rng.random() < 0.1 else f"note {rng.randint(1, 100000)}",
+            ])
+
+
+def bench(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        write_csv(path, rows)
+        size = os.path.getsize(path)
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(path, newline="", encoding="utf-8") as f:
+            profile = profile_csv(f)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{rows:>10,} rows  {size / 1e6:7.1f} MB file  {elapsed:6.1f} s  peak {peak / 1e6:6.1f} MB  profile {len(profile):,} chars")
+
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]:
+        bench(count)
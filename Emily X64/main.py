@@ -10,6 +10,10 @@ import startup as splash
 from login import show_login_window
 from startup import close_application,force_close_application
 import time
+import atexit
+import base64
+import io
+import itertools
 import sqlite3
 import re 
 from pathlib import Path
@@ -23,6 +27,23 @@ from google import genai
 from google.genai import types
 from datetime import datetime
 from modules.cryptoenc import encrypt_json, decrypt_json
+from modules import storage
+from modules.settings_store import SettingsStore
+from modules.write_queue import InteractionWriter
+from modules.maintenance import MaintenanceScheduler
+from modules.request_executor import RequestExecutor
+from modules.chat_session import ChatSessionManager
+from modules.context_budget import count_pdf_pages, estimate_file_tokens, estimate_tokens, fit_history, history_tokens
+from modules.summarizer import ConversationSummarizer, asking_order
+from modules.context_cache import ContextCache, cache_key
+from modules.uploads import upload_all
+from modules.attachments import AttachmentRegistry
+from modules.attachment_cache import AttachmentCache, sha256_bytes, sha256_file
+from modules.resumable_upload import ResumableUploader, parse_rfc3339
+from modules.resilience import CallTimeout, CircuitBreaker, CircuitOpenError, ResilientCaller, RetryBudget
+from modules.text_ingest import TEXT_EXTENSIONS, decode_text, text_parts
+from modules import image_prep
+from modules.csv_profile import head_lines, profile_csv
 
 os.environ["WEBVIEW2_ADDITIONAL_BROWSER_ARGUMENTS"] = (
     "--auto-accept-camera-and-microphone-capture "
@@ -54,6 +75,7 @@ def restart_application():
     release_mutex()
     """Forcefully close the application and restart it"""
     # print'Restarting application...')
+    splash.run_shutdown_hooks()
     
     try:
         # Try to close windows gracefully
@@ -86,12 +108,124 @@ interaction_db_path = appdata_dir / 'interaction_data.dll'
 key_db_path = appdata_dir / 'key_data.dll'
 webview_path = appdata_dir / 'Emily-X64_webview_data'
 
+storage.configure(interaction_db_path, key_db_path)
+settings = SettingsStore()
+# Chat turns are written in the background; make sure they reach disk on every exit path
+interaction_writer = InteractionWriter()
+splash.shutdown_hooks.append(interaction_writer.flush)
+atexit.register(interaction_writer.flush)
+
 app_config_variables = {
     "app_name": "EmilyX64",
     "app_version": "2.2.0.1 Beta",
     "app_version_code": "2201",
     "history_cont": 10,
+    "history_page_size": 20,
+    # Retention: older turns move to the archive table (overridable via the
+    # historyHotRows / historyRetentionDays settings; 0 days = keep forever)
+    "history_hot_rows": 5000,
+    "history_min_hot_rows": 200,
+    "history_retention_days": 365,
+    "maintenance_idle_seconds": 120,
+    "maintenance_interval_hours": 24,
+    # Show the reply in the chat window while Gemini is still generating it
+    "stream_responses": True,
+    # Prompt context, in estimated tokens (chars / 4): a new chat session is
+    # seeded with as many recent messages as fit in context_token_budget (out of
+    # the newest context_scan_rows) after the setup and summary turns, but
+    # never less than context_min_history_tokens, and is rebuilt that way once
+    # the conversation in it (setup and summary turns aside) grows past
+    # context_token_limit
+    "context_scan_rows": 200,
+    "context_token_budget": 6000,
+    "context_min_history_tokens": 2000,
+    "context_token_limit": 12000,
+    # Rolling summaries of messages older than those a chat session keeps
+    # verbatim (the newest summary_keep_recent_rows before one is built)
+    "summary_chunk_rows": 40,
+    "summary_keep_recent_rows": 40,
+    "summary_backfill_rows": 400,
+    "summary_fanout": 4,
+    "summary_max_level": 2,
+    "summary_max_output_tokens": 400,
+    # Keep the system instruction + setup context in Gemini cached content
+    "context_cache_enabled": True,
+    "context_cache_ttl_seconds": 3600,
+    # Attachments upload in parallel; on failure "abort" fails the turn,
+    # "continue" goes on with the files that made it, "require_one" needs at least one
+    "upload_max_workers": 4,
+    "upload_failure_policy": "continue",
+    # "single": attachments and text go to the chat in one turn;
+    # "analyze": describe the files with a separate call first (the old flow)
+    "attachment_mode": "single",
+    # Documents picked through the native dialog are streamed from disk
+    "attachment_max_bytes": 100 * 1024 * 1024,
+    # Uploads and file analyses are reused by content hash (LRU, capped in bytes of stored data)
+    "attachment_cache_max_bytes": 8 * 1024 * 1024,
+    "attachment_cache_max_entries": 500,
+    # Text/code attachments up to this size are sent inline as text instead
+    # of through the Files API, split into parts of inline_text_part_chars
+    "inline_text_max_bytes": 2 * 1024 * 1024,
+    "inline_text_part_chars": 100_000,
+    # Images are downscaled to this longest side and re-encoded before upload
+    # (needs Pillow; without it they are uploaded unchanged)
+    "image_max_dimension": 1536,
+    "image_quality": 85,
+    # CSVs above this size are sent as a local profile plus their first rows
+    "csv_profile_min_bytes": 256 * 1024,
+    "csv_head_rows": 30,
+    # Uploads above this size go through the resumable protocol in chunks
+    # (multiples of 256 KB), resuming after network errors and reporting progress
+    "resumable_upload_min_bytes": 8 * 1024 * 1024,
+    "resumable_chunk_bytes": 8 * 1024 * 1024,
+    "resumable_max_retries": 5,
+    # Gemini calls: per-attempt timeout, retries of transient errors (429/5xx,
+    # network) within a retry budget, hedged duplicates of stateless calls
+    # after the p95 latency, and a circuit breaker that fails fast when the
+    # service keeps failing
+    "gemini_timeout_seconds": 60,
+    "gemini_max_attempts": 3,
+    "gemini_retry_budget_ratio": 0.2,
+    "gemini_hedge_quantile": 0.95,
+    "gemini_circuit_failures": 5,
+    "gemini_circuit_reset_seconds": 30,
 }
+maintenance_scheduler = MaintenanceScheduler(settings, app_config_variables, before_run=interaction_writer.flush)
+# Chat turns run here instead of on pywebview's bridge threads
+request_executor = RequestExecutor()
+CHAT_SESSION = "chat"
+
+def push_backend_status(state):
+    """Tell the user when the circuit breaker stops or resumes Gemini calls."""
+    if not window:
+        return
+    if state == CircuitBreaker.OPEN:
+        toast = {"message": f"Emily's AI service is not responding. Requests are paused for {app_config_variables['gemini_circuit_reset_seconds']} seconds.", "type": "warning", "duration": 6000}
+    elif state == CircuitBreaker.CLOSED:
+        toast = {"message": "Emily's AI service is back.", "type": "success"}
+    else:
+        return
+    window.evaluate_js(f'showToast({json.dumps(toast)})')
+
+gemini_calls = ResilientCaller(
+    timeout=app_config_variables["gemini_timeout_seconds"],
+    max_attempts=app_config_variables["gemini_max_attempts"],
+    hedge_quantile=app_config_variables["gemini_hedge_quantile"],
+    budget=RetryBudget(ratio=app_config_variables["gemini_retry_budget_ratio"]),
+    breaker=CircuitBreaker(
+        failure_threshold=app_config_variables["gemini_circuit_failures"],
+        reset_timeout=app_config_variables["gemini_circuit_reset_seconds"],
+        on_state_change=push_backend_status,
+    ),
+)
+
+def gemini_http_options():
+    """
+    HTTP timeout for generate calls, so attempts gemini_calls has given up on
+    end too. Set per call rather than on the client, which would also cap
+    files.upload and caches.create.
+    """
+    return types.HttpOptions(timeout=app_config_variables["gemini_timeout_seconds"] * 1000)
 
 
 
@@ -99,12 +233,7 @@ app_config_variables = {
 
 def remove_record(id):
     try:
-        conn = sqlite3.connect(key_db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM key WHERE type = ?', (id,))
-        conn.commit()
-        conn.close()
-        return cursor.rowcount  # Number of rows affected
+        return settings.delete(id)  # Number of rows affected
     except sqlite3.Error as e:
         # printf"An error occurred: {e}")
         show_native_error_box('Error', f"An error occurred: {e}")
@@ -113,34 +242,34 @@ def remove_record(id):
 
 def add_record(id, value):
     try:
-        conn = sqlite3.connect(key_db_path)
-        cursor = conn.cursor()
-        # First check if record exists
-        cursor.execute('SELECT type FROM key WHERE type = ?', (id,))
-        exists = cursor.fetchone()
-        
-        if exists:
-            # Update existing record
-            cursor.execute('UPDATE key SET value = ? WHERE type = ?', (value, id))
-        else:
-            # Insert new record
-            cursor.execute('INSERT INTO key (type, value) VALUES (?, ?)', (id, value))
-            
-        conn.commit()
-        conn.close()
+        settings.set(id, value)
+    except sqlite3.Error as e:
+        # printf"An error occurred: {e}")
+        show_native_error_box('Error', f"An error occurred: {e}")
+        force_close_application()
+
+def set_many(values):
+    """Write several settings in one transaction"""
+    try:
+        settings.set_many(values)
+    except sqlite3.Error as e:
+        # printf"An error occurred: {e}")
+        show_native_error_box('Error', f"An error occurred: {e}")
+        force_close_application()
+
+def delete_many(ids):
+    """Remove several settings in one transaction"""
+    try:
+        return settings.delete_many(ids)
     except sqlite3.Error as e:
         # printf"An error occurred: {e}")
         show_native_error_box('Error', f"An error occurred: {e}")
         force_close_application()
+        return -1
 
 def get_value_by_id(id):
     try:
-        conn = sqlite3.connect(key_db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT value FROM key WHERE type = ?', (id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        return settings.get(id)
     except sqlite3.Error as e:
         # printf"An error occurred: {e}")
         show_native_error_box('Error', f"An error occurred: {e}")
@@ -153,26 +282,23 @@ def check_session_data():
         refresh_token = get_value_by_id('refresh_token')
         user_id = get_value_by_id('user_id')
         if session_token == None or refresh_token == None or user_id == None:
-            remove_record('session_token')
-            remove_record('refresh_token')
-            remove_record('user_id')
+            delete_many(['session_token', 'refresh_token', 'user_id'])
             # print"Session data not found, showing login window...")
             return False
         else:
             # print"Session data found, Verifying with user ID:", user_id)
             responce  = refresh_token_hendler(api_uris['token_refresh_api'], session_token, user_id , device_id, refresh_token)
             if responce['success']:
-                remove_record('session_token')
-                remove_record('refresh_token')
-                add_record('session_token', responce['data']['session_token'])
-                add_record('refresh_token', responce['data']['refresh_token'])
+                # Both tokens are replaced together or not at all
+                set_many({
+                    'session_token': responce['data']['session_token'],
+                    'refresh_token': responce['data']['refresh_token']
+                })
                 # print"Session data verified successfully.")
                 return True
             else:
                 # print"Session data verification failed, showing login window...")
-                remove_record('session_token')
-                remove_record('refresh_token')
-                remove_record('user_id')
+                delete_many(['session_token', 'refresh_token', 'user_id'])
                 show_info_box('Session Expired', f'Your session has expired. Please login again. \n Reason : {responce["message"]}')
                 return False
     except Exception as e:
@@ -181,80 +307,33 @@ def check_session_data():
         force_close_application()
 
 def get_interactions(history_cont,timestamp=False):
-    limit = str(history_cont)  # ensure this is a number as string
-    conn = sqlite3.connect(interaction_db_path)
-    cursor = conn.cursor()
-    if timestamp:
-        cursor.execute('''
-            SELECT role, parts, timestamp
-            FROM interactions
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (limit,))
-    else:
-        cursor.execute('''
-            SELECT role, parts
-            FROM interactions 
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
-
+    interaction_writer.flush()
     # Format correctly for Gemini
-    if timestamp:
-        return [
-            {
-                "role": role,
-                "parts": [{"text": parts}],
-                "timestamp": timestamp_val
-            }
-            for role, parts, timestamp_val in rows
-        ]
-    else:
-        return [
-            {
-                "role": role,
-                "parts": [{"text": parts}]
-            }
-            for role, parts in rows
-        ]
+    return storage.get_interactions(history_cont, timestamp)
 
 def empty_database():
-    conn = sqlite3.connect(interaction_db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM interactions
-    ''')
-    conn.commit()
-    conn.close()
+    interaction_writer.flush()
+    storage.empty_database()
 
 
 def insert_into_db(role, parts):
-    conn = sqlite3.connect(interaction_db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO interactions (role, parts, timestamp)
-    VALUES (?, ?, ?)
-    ''', (role, parts, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    storage.insert_into_db(role, parts)
+
+def insert_interactions(rows, clear_existing=False):
+    interaction_writer.flush()
+    return storage.insert_interactions(rows, clear_existing)
 
 def setdefolts():
     try:
-        # Check if userLang already exists
-        existing_lang = get_value_by_id('userLang')
-        if existing_lang is None:
-            # Only add if it doesn't exist
-            add_record('userLang', 'en-IN')
-        existing_isvoiseactive = get_value_by_id('isvoiseactive')
-        if existing_isvoiseactive is None:
-            # Only add if it doesn't exist
-            add_record('isvoiseactive', 'True')
-        existing_newuser = get_value_by_id('newuser')
-        if existing_newuser is None:
-            # Only add if it doesn't exist
-            add_record('newuser', 'false')
+        defaults = {
+            'userLang': 'en-IN',
+            'isvoiseactive': 'True',
+            'newuser': 'false'
+        }
+        # Only add the ones that don't exist yet
+        missing = {key: value for key, value in defaults.items() if get_value_by_id(key) is None}
+        if missing:
+            set_many(missing)
             
     except Exception as e:
         # printf"Error setting defaults: {e}")
@@ -262,35 +341,19 @@ def setdefolts():
 
 def initialize_databases():
     try:
-        # Create interaction database if it doesn't exist
+        # Create the databases if they don't exist and bring their schema up to date
         if not interaction_db_path.exists():
             splash.update_splash_text('Creating User Credentials..') 
-            conn = sqlite3.connect(interaction_db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS interactions (
-                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
-                    role TEXT NOT NULL,
-                    parts TEXT NOT NULL,
-                    timestamp TEXT NOT NULL
-                )
-            ''')
-            conn.commit()
-            conn.close()
+        elif storage.schema_version(storage.INTERACTION_DB) < len(storage.INTERACTION_MIGRATIONS):
+            splash.update_splash_text('Upgrading User Credentials..')
+        storage.migrate(storage.INTERACTION_DB)
 
-        # Create key database if it doesn't exist
         if not key_db_path.exists():
             splash.update_splash_text('Creating User Data..')
-            conn = sqlite3.connect(key_db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS key (
-                    type TEXT NOT NULL UNIQUE,
-                    value TEXT NOT NULL
-                )
-            ''')
-            conn.commit()
-            conn.close()
+        elif storage.schema_version(storage.KEY_DB) < len(storage.KEY_MIGRATIONS):
+            splash.update_splash_text('Upgrading User Data..')
+        storage.migrate(storage.KEY_DB)
+        settings.load()
         setdefolts()
         return True, "Data initialized successfully."
 
@@ -462,6 +525,8 @@ def main_entry():
                     genai_client = genai.Client(api_key=APP_CONFIG["gemini"]["api_key"])
                     # print"Gemini API client initialized successfully")
                     add_loader_log("Emily client initialized successfully.", "success")
+                    # Build the chat session (history, HA discovery) before the first message needs it
+                    chat_sessions.warm_up()
                     force_close_loader()
                     return
                 except Exception as e:
@@ -495,6 +560,315 @@ gemini_chat = None
 gemini_generate_content = None
 
 
+def summary_seed_turns():
+    """The stored rolling summaries as a system turn for a new chat, or [] if there are none."""
+    summary = conversation_summarizer.context_text()
+    if not summary:
+        return []
+    return [
+        {"role": "user", "parts": [{"text": f"::SYSTEM2D2F4G5S3D:: No need to reply on this message. Summary of earlier conversations with the user (oldest first): \n {summary}"}]},
+        {"role": "model", "parts": [{"text": "Understood."}]},
+    ]
+
+
+def build_chat_session():
+    """
+    Create the Gemini chat with recent history and the setup context.
+
+    Older conversations come in as the stored rolling summaries and recent
+    history is filled newest-first up to context_token_budget, then seeded
+    oldest first after them, so the prompt size stays flat however long
+    the history gets. Messages older than the kept ones are summarized
+    first (one model call on a rotation), so nothing falls between the
+    summaries and the verbatim turns.
+
+    The user/app/Home Assistant context is added to the history as a
+    system turn rather than sent with send_message, so building the
+    session costs no model call. Together with the system instruction and
+    tools it is kept in Gemini cached content (see ContextCache) and only
+    re-uploaded when one of them changes; without a cache it is sent
+    inline as before.
+    """
+    tools = [
+        types.Tool(google_search=types.GoogleSearch()),
+        types.Tool(url_context=types.UrlContext()),
+    ]
+    applistmain = [(a["name"], a["code"]) for a in (json.loads(SYSTEM_CONFIG["APP_LIST"])["apps"] if SYSTEM_CONFIG.get("APP_LIST") else [])] or None
+    if settings.get_bool('HAEnabled'):
+        # Get actual HA data for commands
+        try:
+            ha_data = settings.get_json('HA_DATA')
+            if ha_data:
+                command = generate_home_assistant_commands(ha_data.get('url', 'http://localhost:8123'), ha_data.get('token', ''))
+            else:
+                command = "home assistant commands are not available (no configuration)"
+        except:
+            command = "home assistant commands are not available (invalid configuration)"
+    else:
+        command = "home assistant commands are not available"
+    setup_message = f"::SYSTEM2D2F4G5S3D:: No need to reply on this message. this is a system message, it contains the user and system information. \n User's name is {APP_CONFIG['user']['name']}\nlist of apps that can be opened by you and their codes. \n {applistmain}\n These are the avalable home assistant commands to control devises: \n {command}"
+    # printf"\n\nsetup message is : \n {setup_message}")
+    setup_turns = [
+        {"role": "user", "parts": [{"text": setup_message}]},
+        {"role": "model", "parts": [{"text": "Understood."}]},
+    ]
+    budget = max(app_config_variables["context_min_history_tokens"],
+                 app_config_variables["context_token_budget"] - estimate_tokens(setup_message) - history_tokens(summary_seed_turns()))
+    interaction_writer.flush()
+    recent = storage.get_recent_interactions(app_config_variables["context_scan_rows"])
+    kept = len(fit_history([{"role": role, "parts": [{"text": text}]} for _, role, text in recent], budget))
+    if 1 < kept < len(recent) and recent[kept - 1][1] == "user" and recent[kept][1] == "model" and recent[kept][0] == recent[kept - 1][0] - 1:
+        # Don't seed a question without the answer stored just before it
+        kept -= 1
+    history = [{"role": role, "parts": [{"text": text}]} for _, role, text in asking_order(recent[:kept][::-1])]
+    try:
+        # Summarize what was left out, so the summaries reach the oldest kept turn
+        conversation_summarizer.cover_until(recent[kept - 1][0] if kept else None)
+    except Exception as e:
+        # The session still works; the summarizer retries after the next turn
+        conversation_summarizer.last_error = e
+    summary_turns = summary_seed_turns()
+
+    cached_content = None
+    if app_config_variables["context_cache_enabled"]:
+        model = APP_CONFIG["gemini"]["model"]
+        cached_content = context_cache.get(
+            genai_client,
+            cache_key(model, APP_CONFIG["system_instruction"], setup_message),
+            lambda ttl: genai_client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(system_instruction=APP_CONFIG["system_instruction"],tools=tools,contents=setup_turns,ttl=ttl,display_name="emily-setup-context"),
+            ),
+        )
+    if cached_content:
+        # Instruction, tools and setup turns live in the cache
+        config = types.GenerateContentConfig(http_options=gemini_http_options(),cached_content=cached_content,response_mime_type="text/plain",max_output_tokens=APP_CONFIG["gemini"]["max_output_tokens"],temperature=APP_CONFIG["gemini"]["model_temp"])
+        seed_turns = summary_turns
+    else:
+        config = types.GenerateContentConfig(http_options=gemini_http_options(),system_instruction=APP_CONFIG["system_instruction"],tools=tools,response_mime_type="text/plain",max_output_tokens=APP_CONFIG["gemini"]["max_output_tokens"],temperature=APP_CONFIG["gemini"]["model_temp"])
+        seed_turns = setup_turns + summary_turns
+    chat = genai_client.chats.create(
+        model=APP_CONFIG["gemini"]["model"],
+        config=config,
+        history=seed_turns + history,
+    )
+    # The rotation check measures the conversation only, not these fixed turns
+    chat.seed_turns = len(seed_turns)
+    return chat
+
+context_cache = ContextCache(settings, ttl_seconds=app_config_variables["context_cache_ttl_seconds"])
+chat_sessions = ChatSessionManager(build_chat_session)
+
+
+SUMMARY_PROMPTS = {
+    "turns": "Summarize this part of a conversation between the user and Emily (the assistant) in at most 120 words. Keep facts about the user, their preferences, decisions made and open tasks; drop small talk. Reply with the summary only.\n\n",
+    "summaries": "Merge these consecutive summaries of a conversation between the user and Emily (the assistant) into one summary of at most 150 words. Keep facts about the user, their preferences, decisions made and open tasks. Reply with the summary only.\n\n",
+}
+
+def summarize_history(text, kind):
+    """Summarize a transcript or merge summaries with a single model call."""
+    response = gemini_calls.call(
+        genai_client.models.generate_content,
+        model=APP_CONFIG["gemini"]["model"],
+        contents=SUMMARY_PROMPTS[kind] + text,
+        config=types.GenerateContentConfig(http_options=gemini_http_options(),response_mime_type="text/plain",max_output_tokens=app_config_variables["summary_max_output_tokens"],temperature=0.2),
+        kind="summary", idempotent=True,
+    )
+    return (response.text or "").strip()
+
+conversation_summarizer = ConversationSummarizer(
+    summarize_history,
+    chunk_rows=app_config_variables["summary_chunk_rows"],
+    keep_recent_rows=app_config_variables["summary_keep_recent_rows"],
+    backfill_rows=app_config_variables["summary_backfill_rows"],
+    fanout=app_config_variables["summary_fanout"],
+    max_level=app_config_variables["summary_max_level"],
+    before_run=interaction_writer.flush,
+)
+
+
+def send_chat_message(message, stream_id=None, cancel_token=None):
+    """
+    Send `message` (text, or a list of uploaded files and text) on the
+    shared chat and return the reply text.
+
+    With streaming enabled each chunk is pushed to the chat window via
+    appendToMessage() as it arrives. The partial bubble is replaced by the
+    next addMessageToChat() call, i.e. the final command-processed reply.
+    Cancelling `cancel_token` closes the stream between chunks; the
+    unfinished turn is not added to the chat history.
+
+    Calls go through gemini_calls. A send adds the turn to the chat history
+    when it succeeds, so it is retried after errors but never hedged or
+    retried after a timeout. A stream whose opening attempt was abandoned
+    is closed as soon as that attempt returns.
+    """
+    if not stream_id or not app_config_variables["stream_responses"]:
+        return gemini_calls.call(gemini_chat.send_message, message, kind="chat", cancel_token=cancel_token).text
+    chat = gemini_chat
+
+    def open_stream():
+        stream = chat.send_message_stream(message)
+        return stream, next(stream, None)
+
+    chunks = []
+    stream, first = gemini_calls.call(open_stream, kind="chat_stream", cancel_token=cancel_token,
+                                      on_discard=lambda opened: opened[0].close())
+    try:
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            if cancel_token:
+                cancel_token.check()
+            text = chunk.text
+            if not text:
+                continue
+            chunks.append(text)
+            if window:
+                window.evaluate_js(f'appendToMessage({json.dumps(stream_id)}, {json.dumps(text)})')
+    finally:
+        stream.close()
+    return "".join(chunks)
+
+# Map file extensions to MIME types
+ATTACHMENT_MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'js': 'application/x-javascript',
+    'py': 'application/x-python',
+    'txt': 'text/plain',
+    'html': 'text/html',
+    'css': 'text/css',
+    'md': 'text/markdown',
+    'csv': 'text/csv',
+    'xml': 'text/xml',
+    'rtf': 'application/rtf',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif'
+}
+
+attachments = AttachmentRegistry()
+
+attachment_cache = AttachmentCache(
+    max_bytes=app_config_variables["attachment_cache_max_bytes"],
+    max_entries=app_config_variables["attachment_cache_max_entries"],
+)
+
+# Estimated context cost of every uploaded file by URI; file parts stay in
+# the chat history, so the rotation check must count them at their real size
+attachment_tokens = {}
+
+def file_part(uri, mime_type, path=None, file_data=None):
+    """A chat Part for an uploaded file, recording its estimated token cost."""
+    size = os.path.getsize(path) if path else len(file_data)
+    pages = 0
+    if mime_type == 'application/pdf':
+        with (open(path, 'rb') if path else io.BytesIO(file_data)) as f:
+            pages = count_pdf_pages(f)
+    attachment_tokens[uri] = estimate_file_tokens(mime_type, size, pages)
+    return types.Part.from_uri(file_uri=uri, mime_type=mime_type)
+
+def upload_attachment(file_info, cancel_token=None):
+    """
+    Upload one attachment sent by the frontend to Gemini.
+
+    Files picked with pick_attachments() arrive as a handle and are
+    streamed from disk by the SDK; others are base64 data URLs. Text and
+    code files are decoded locally and returned as inline text instead of
+    being uploaded. A file whose content was uploaded before and has not
+    expired is not sent again. Images are downscaled and stripped of
+    metadata first (image_prep) and large CSVs are replaced by a local
+    profile (csv_profile); this runs in the upload worker pool, off the
+    bridge thread. Large files use the resumable protocol and report
+    progress to the frontend; cancelling `cancel_token` stops them between
+    chunks. Returns (parts, sha256 of the content).
+    """
+    file_extension = file_info['name'].split('.')[-1].lower()
+    mime_type = ATTACHMENT_MIME_TYPES.get(file_extension)
+    if not mime_type:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+    path = file_data = None
+    if attachments.is_reference(file_info.get('data')):
+        path = attachments.resolve(file_info['data'])
+        attachments.release(file_info['data'])
+        if not path or not os.path.isfile(path):
+            raise ValueError("File is no longer available")
+        if file_extension in TEXT_EXTENSIONS and os.path.getsize(path) <= app_config_variables["inline_text_max_bytes"]:
+            with open(path, 'rb') as f:
+                file_data = f.read()
+            path = None
+            digest = sha256_bytes(file_data)
+        else:
+            digest = sha256_file(path)
+    else:
+        file_data = base64.b64decode(file_info['data'].split(',')[1])
+        digest = sha256_bytes(file_data)
+
+    if file_extension == 'csv' and (os.path.getsize(path) if path else len(file_data)) > app_config_variables["csv_profile_min_bytes"]:
+        # Schema, statistics and a sample computed locally, streaming from disk when possible
+        head_rows = app_config_variables["csv_head_rows"]
+        if path:
+            with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+                profile = profile_csv(f)
+            with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+                head = head_lines(f, head_rows)
+        else:
+            text = decode_text(file_data)
+            profile = profile_csv(io.StringIO(text, newline=''))
+            head = head_lines(io.StringIO(text, newline=''), head_rows)
+        summary = f"{profile}\n\nFirst {head_rows} rows of the file:\n{head}"
+        return text_parts(file_info['name'], summary, app_config_variables["inline_text_part_chars"]), digest
+
+    if file_data is not None and file_extension in TEXT_EXTENSIONS and len(file_data) <= app_config_variables["inline_text_max_bytes"]:
+        # No upload and no remote processing needed for plain text
+        return text_parts(file_info['name'], decode_text(file_data), app_config_variables["inline_text_part_chars"]), digest
+
+    cached = attachment_cache.get_upload(digest)
+    if cached:
+        # printf"Reusing upload {cached['remote_name']} for {file_info['name']}")
+        return [file_part(cached["uri"], cached["mime_type"], path, file_data)], digest
+    if file_data is not None and mime_type.startswith('image/'):
+        prepared = image_prep.prepare_image(file_data, app_config_variables["image_max_dimension"], app_config_variables["image_quality"])
+        if prepared:
+            file_data, mime_type = prepared
+    size = os.path.getsize(path) if path else len(file_data)
+    if size >= app_config_variables["resumable_upload_min_bytes"]:
+        # printf"Resumable upload: {file_info['name']} ({size} bytes)")
+        uploader = ResumableUploader(
+            APP_CONFIG["gemini"]["api_key"],
+            chunk_size=app_config_variables["resumable_chunk_bytes"],
+            max_retries=app_config_variables["resumable_max_retries"],
+        )
+        remote = uploader.upload(
+            path if path else file_data, mime_type, display_name=file_info['name'],
+            on_progress=lambda sent, total: push_upload_progress(file_info['name'], sent, total),
+            cancel_token=cancel_token,
+        )
+        remote_mime = remote.get("mimeType", mime_type)
+        attachment_cache.put_upload(digest, remote.get("name"), remote["uri"], remote_mime, parse_rfc3339(remote.get("expirationTime")))
+        return [file_part(remote["uri"], remote_mime, path, file_data)], digest
+    # printf"Uploading file: {file_info['name']} with MIME type: {mime_type}")
+    uploaded_file = genai_client.files.upload(
+        file=path if path else io.BytesIO(file_data),
+        config=dict(mime_type=mime_type)
+    )
+    expires_at = uploaded_file.expiration_time.timestamp() if uploaded_file.expiration_time else None
+    attachment_cache.put_upload(digest, uploaded_file.name, uploaded_file.uri, uploaded_file.mime_type, expires_at)
+    return [file_part(uploaded_file.uri, uploaded_file.mime_type, path, file_data)], digest
+
+def push_upload_status(name, status, error=None):
+    if window:
+        args = [name, status] + ([error] if error else [])
+        window.evaluate_js(f'showFileUploadStatus({", ".join(json.dumps(a) for a in args)})')
+
+def push_upload_progress(name, sent, total):
+    if window:
+        window.evaluate_js(f'showFileUploadProgress({json.dumps(name)}, {sent}, {total})')
+
+def notify_request_done(request_id, status, error):
+    """Settle the frontend promise for a request started with submit_message()."""
+    if window:
+        window.evaluate_js(f'resolveBackendRequest({json.dumps(request_id)}, {json.dumps(status)}, {json.dumps(str(error) if error else None)})')
+
 
 
 # API class for better functionality organization and exposure to JavaScript
@@ -512,25 +886,28 @@ class API:
             
             # print'saving settings: ' + voice_lang + ', ' + ai_speech_enabled + ', HA: ' + str(home_assistant_enabled))
             
-            # Save basic settings
-            add_record('userLang', voice_lang)
-            add_record('isvoiseactive', ai_speech_enabled)
-            add_record('newuser', 'true')  # Mark setup as complete
+            # Basic settings
+            new_settings = {
+                'userLang': voice_lang,
+                'isvoiseactive': ai_speech_enabled,
+                'newuser': 'true'  # Mark setup as complete
+            }
             
-            # Save Home Assistant settings if enabled
+            # Home Assistant settings if enabled
             if home_assistant_enabled and home_assistant_url and home_assistant_token:
-                ha_data = json.dumps({
+                new_settings['HA_DATA'] = json.dumps({
                     'url': home_assistant_url,
                     'token': home_assistant_token
                 })
-                
-                add_record('HA_DATA', ha_data)
-                add_record('HAEnabled', 'true')
+                new_settings['HAEnabled'] = 'true'
                 # print'Home Assistant settings saved')
             else:
-                add_record('HAEnabled', 'false')
+                new_settings['HAEnabled'] = 'false'
                 # print'Home Assistant disabled')
             
+            # Save everything in one transaction
+            set_many(new_settings)
+            
             restart_application()
         except Exception as e:
             # printf"An error occurred while saving data: {e}")
@@ -589,6 +966,38 @@ class API:
             # printf"Error clearing history: {e}")
             return {"success": False, "message": str(e)}
         
+    def recompress_history(self):
+        """Maintenance: re-encode stored chat history with the current compression settings"""
+        try:
+            interaction_writer.flush()
+            stats = storage.recompress_interactions()
+            # Measured on the database pages, not the payload, so it is what the file really loses
+            saved = stats['db_bytes_before'] - stats['db_bytes_after']
+            return {
+                "success": True,
+                "message": f"Recompressed {stats['rows_changed']} messages, saved {saved / 1024:.1f} KB.",
+                "rows_changed": stats['rows_changed'],
+                "bytes_before": stats['bytes_before'],
+                "bytes_after": stats['bytes_after'],
+                "db_bytes_before": stats['db_bytes_before'],
+                "db_bytes_after": stats['db_bytes_after'],
+                "bytes_saved": saved
+            }
+        except Exception as e:
+            # printf"Error recompressing history: {e}")
+            return {"success": False, "message": str(e)}
+
+    def run_maintenance(self):
+        """Maintenance: archive old history and compact the databases now"""
+        try:
+            report = maintenance_scheduler.run_now(force=True)
+            if report is None:
+                return {"success": False, "message": "Maintenance is already running."}
+            return {"success": True, "message": f"Archived {report['archived']} messages.", "report": report}
+        except Exception as e:
+            # printf"Error running maintenance: {e}")
+            return {"success": False, "message": str(e)}
+
     def save_app_data(self,data):
         try:
             add_record('APPLISTDATA', data)
@@ -600,8 +1009,7 @@ class API:
     
     def save_ha_data(self,data,sts):
         try:
-            add_record('HA_DATA', data)
-            add_record('HAEnabled', str(sts))
+            set_many({'HA_DATA': data, 'HAEnabled': str(sts)})
             # printf"HA data: {data}")
             # printf"HA enabled: {sts}")
             restart_application()
@@ -616,20 +1024,10 @@ class API:
     def get_ha_data(self):
         """Get Home Assistant data"""
         ha_data = get_value_by_id('HA_DATA')
-        ha_enabled_raw = get_value_by_id('HAEnabled')
-        
-        # Convert ha_enabled to proper boolean
-        ha_enabled = False
-        if ha_enabled_raw is not None:
-            if isinstance(ha_enabled_raw, str):
-                ha_enabled = ha_enabled_raw.lower() in ['true', '1', 'yes']
-            elif isinstance(ha_enabled_raw, (int, float)):
-                ha_enabled = bool(ha_enabled_raw)
-            else:
-                ha_enabled = bool(ha_enabled_raw)
+        ha_enabled = settings.get_bool('HAEnabled')
         
         # printf"HA data: {ha_data}")
-        # printf"HA enabled raw: {ha_enabled_raw}, converted: {ha_enabled}")
+        # printf"HA enabled: {ha_enabled}")
         return {
             "ha_data": ha_data,
             "ha_enabled": ha_enabled
@@ -707,24 +1105,23 @@ class API:
             if not user_chat_history:
                 return {"success": False, "message": "No chat history found in backup file."}
             
-            # Clear existing database
-            empty_database()
-            
-            # Restore chat history
-            restored_count = 0
-            for interaction in user_chat_history:
+            # Collect valid interactions; backups are newest-first, the table is oldest-first
+            rows = []
+            for interaction in reversed(user_chat_history):
                 try:
                     role = interaction.get('role')
                     parts = interaction.get('parts', [{}])[0].get('text', '')
-                    timestamp = interaction.get('timestamp', datetime.now().isoformat())
+                    timestamp = interaction.get('timestamp') or datetime.now().isoformat()
                     
                     if role and parts:
-                        insert_into_db(role, parts)
-                        restored_count += 1
+                        rows.append((role, parts, timestamp))
                 except Exception as e:
                     # printf"Error restoring interaction: {e}")
                     continue
             
+            # Replace existing history with the backup in a single transaction
+            restored_count = insert_interactions(rows, clear_existing=True) if rows else 0
+            
             if restored_count > 0:
                 return {
                     "success": True, 
@@ -819,13 +1216,10 @@ class API:
         if result['success']:
             try:
                 # Remove session data from database
-                self.remove_record('session_token')
-                self.remove_record('refresh_token')
-                self.remove_record('user_id')
-                self.remove_record('newuser')
-                self.remove_record('HA_DATA')
-                self.remove_record('HAEnabled')
+                delete_many(['session_token', 'refresh_token', 'user_id', 'newuser', 'HA_DATA', 'HAEnabled'])
                 empty_database()
+                # The cached prefix holds the user's name and HA catalog
+                context_cache.clear(genai_client)
                 time.sleep(3)
                 restart_application()
                 return {"success": True, "message": "Session cleared successfully"}
@@ -835,24 +1229,47 @@ class API:
         else:
             return {"success": False, "message": f"Failed to clear session: {result['message']}"}
 
-    def get_chat_history(self):
-        """Get chat history for display in frontend"""
+    def get_chat_history(self, before_id=None, limit=None):
+        """
+        Get one page of chat history for display in frontend (newest first).
+
+        Pass the returned `next_cursor` as `before_id` to load older messages.
+        """
         try:
-            history = get_interactions(50, timestamp=True)  # Get last 50 interactions with timestamps
+            limit = max(1, min(int(limit or app_config_variables['history_page_size']), 200))
+            interaction_writer.flush()
+            history, has_more = storage.get_interactions_page(before_id, limit)
             
-            # Clean each message in the history
-            cleaned_history = []
+            # Clean each message in the page (remove @cmd[...] blocks)
             for interaction in history:
-                cleaned_interaction = interaction.copy()
-                # Clean the parts text (remove @cmd[...] blocks)
-                if 'parts' in cleaned_interaction and len(cleaned_interaction['parts']) > 0:
-                    cleaned_interaction['parts'][0]['text'] = _clean_message(cleaned_interaction['parts'][0]['text'])
-                cleaned_history.append(cleaned_interaction)
+                interaction['parts'][0]['text'] = _clean_message(interaction['parts'][0]['text'])
             
-            return {"success": True, "history": cleaned_history}
+            return {
+                "success": True,
+                "history": history,
+                "next_cursor": history[-1]['id'] if history else None,
+                "has_more": has_more
+            }
         except Exception as e:
             # printf"Error getting chat history: {e}")
             return {"success": False, "message": str(e)}
+
+    def search_history(self, query, limit=20, offset=0):
+        """Search past conversations; returns ranked snippets (best match first)."""
+        try:
+            limit = max(1, min(int(limit or 20), 100))
+            offset = max(0, int(offset or 0))
+            interaction_writer.flush()
+            results, has_more = storage.search_interactions(str(query or ''), limit, offset)
+
+            # Hide @cmd[...] blocks the snippet may have caught
+            for result in results:
+                result['snippet'] = _clean_message(result['snippet'])
+
+            return {"success": True, "results": results, "has_more": has_more}
+        except Exception as e:
+            # printf"Error searching history: {e}")
+            return {"success": False, "message": str(e)}
     def generate_responce(self, message_data_json: str) -> None:
         """
         Receives message data from the frontend, processes it,
@@ -867,17 +1284,19 @@ class API:
                 types.Tool(google_search=types.GoogleSearch()),
                 types.Tool(url_context=types.UrlContext()),
             ]
-            genai_config_content = types.GenerateContentConfig(
+            genai_config_content = types.GenerateContentConfig(http_options=gemini_http_options(),
                 system_instruction=APP_CONFIG["system_instruction"],
                 tools=tools,
                 response_mime_type="text/plain",
                 max_output_tokens=APP_CONFIG["gemini"]["max_output_tokens"],
                 temperature=APP_CONFIG["gemini"]["model_temp"]
             )
-            response = genai_client.models.generate_content(
+            response = gemini_calls.call(
+                genai_client.models.generate_content,
                 model=APP_CONFIG["gemini"]["model"],
                 contents=user_message,
-                config=genai_config_content
+                config=genai_config_content,
+                kind="generate", idempotent=True,
             )
             return {"success": True, "response": response.text}
         except Exception as e:
@@ -976,11 +1395,37 @@ class API:
         return response_text, runs
 
 
+    def submit_message(self, message_data_json: str, isvoiseactive: bool) -> Dict[str, Any]:
+        """
+        Queue a chat turn and return its request ID immediately.
+
+        The reply is delivered through addMessageToChat() as before and the
+        frontend is told the request finished via resolveBackendRequest().
+        Turns run one at a time in the order they were submitted.
+        """
+        maintenance_scheduler.touch()
+        request_id = request_executor.submit(self._process_message, message_data_json, isvoiseactive,
+                                             session=CHAT_SESSION, on_done=notify_request_done)
+        return {"success": True, "request_id": request_id}
+
+    def cancel_request(self, request_id: str) -> Dict[str, Any]:
+        """Stop a request started with submit_message()."""
+        if request_executor.cancel(request_id):
+            return {"success": True, "message": "Request cancelled"}
+        return {"success": False, "message": "Request not found or already finished"}
+
     def send_message_to_backend(self, message_data_json: str, isvoiseactive: bool) -> None:
         """
         Receives message data from the frontend, processes it,
         and sends a response back using Gemini API if available.
+        Blocks until the turn is done; submit_message() is the non-blocking form.
         """
+        maintenance_scheduler.touch()
+        request_id = request_executor.submit(self._process_message, message_data_json, isvoiseactive, session=CHAT_SESSION)
+        request_executor.wait(request_id)
+
+    def _process_message(self, cancel_token, message_data_json: str, isvoiseactive: bool) -> None:
+        stream_id = f"stream-{time.time_ns()}"
         try:
             message_data = json.loads(message_data_json)
             user_message = message_data.get('text', '')
@@ -998,139 +1443,37 @@ class API:
                 try:
                     # Handle file uploads if present
                     uploaded_files = []
+                    file_digests = []
+                    failure_note = ""
                     if files_info:
-                        for file_info in files_info:
-                            try:
-                                # Send initial upload status
-                                if window:
-                                    window.evaluate_js(f'''
-                                        showFileUploadStatus(
-                                            "{file_info['name']}", 
-                                            "uploading"
-                                        )
-                                    ''')
-                                
-                                # Decode base64 data
-                                import base64
-                                import io
-                                file_data = base64.b64decode(file_info['data'].split(',')[1])
-                                
-                                # Create a BytesIO object
-                                file_buffer = io.BytesIO(file_data)
-                                
-                                # Determine MIME type based on file extension
-                                mime_type = None
-                                file_extension = file_info['name'].split('.')[-1].lower()
-                                
-                                # Map file extensions to MIME types
-                                mime_type_map = {
-                                    'pdf': 'application/pdf',
-                                    'js': 'application/x-javascript',
-                                    'py': 'application/x-python',
-                                    'txt': 'text/plain',
-                                    'html': 'text/html',
-                                    'css': 'text/css',
-                                    'md': 'text/markdown',
-                                    'csv': 'text/csv',
-                                    'xml': 'text/xml',
-                                    'rtf': 'application/rtf',
-                                    'jpg': 'image/jpeg',
-                                    'jpeg': 'image/jpeg',
-                                    'png': 'image/png',
-                                    'gif': 'image/gif'
-                                }
-                                
-                                mime_type = mime_type_map.get(file_extension)
-                                
-                                if mime_type:
-                                    # printf"Uploading file: {file_info['name']} with MIME type: {mime_type}")
-                                    
-                                    uploaded_file = genai_client.files.upload(
-                                        file=file_buffer,
-                                        config=dict(mime_type=mime_type)
-                                    )
-                                    uploaded_files.append(uploaded_file)
-                                    # printf"File {file_info['name']} uploaded successfully")
-                                    
-                                    if window:
-                                        window.evaluate_js(f'''
-                                            showFileUploadStatus(
-                                                "{file_info['name']}", 
-                                                "success"
-                                            )
-                                        ''')
-                                else:
-                                    error_msg = f"Unsupported file type: {file_extension}"
-                                    # printerror_msg)
-                                    
-                                    # Send error status
-                                    if window:
-                                        window.evaluate_js(f'''
-                                            showFileUploadStatus(
-                                                "{file_info['name']}", 
-                                                "error",
-                                                "{error_msg}"
-                                            )
-                                        ''')
-                                    raise ValueError(error_msg)
-                                    
-                            except Exception as e:
-                                error_msg = str(e)
-                                # printf"Error uploading file {file_info['name']}: {error_msg}")
-                                
-                                # Send error status
-                                if window:
-                                    window.evaluate_js(f'''
-                                        showFileUploadStatus(
-                                            "{file_info['name']}", 
-                                            "error",
-                                            "{error_msg}"
-                                        )
-                                    ''')
-                                raise
+                        uploaded, failed_files = upload_all(
+                            files_info,
+                            lambda file_info: upload_attachment(file_info, cancel_token),
+                            max_workers=app_config_variables["upload_max_workers"],
+                            policy=app_config_variables["upload_failure_policy"],
+                            on_status=push_upload_status,
+                            cancel_token=cancel_token,
+                        )
+                        uploaded_files = [part for parts, _ in uploaded for part in parts]
+                        file_digests = [digest for _, digest in uploaded]
+                        if failed_files:
+                            failure_note = "\n(These attached files could not be uploaded, tell the user: " + ", ".join(f"{name} - {error}" for name, error in failed_files) + ")"
 
+                    cancel_token.check()
                     # Generate response using the appropriate method
                     global gemini_chat
-                    homeassistent_raw = get_value_by_id('HAEnabled')
-                    
-                    # Convert homeassistent to proper boolean
-                    homeassistent = False
-                    if homeassistent_raw is not None:
-                        if isinstance(homeassistent_raw, str):
-                            homeassistent = homeassistent_raw.lower() in ['true', '1', 'yes']
-                        elif isinstance(homeassistent_raw, (int, float)):
-                            homeassistent = bool(homeassistent_raw)
-                        else:
-                            homeassistent = bool(homeassistent_raw)
-                    
-                    if gemini_chat is None:
-                            tools = [
-                                types.Tool(google_search=types.GoogleSearch()),
-                                types.Tool(url_context=types.UrlContext()),
-                            ]
-                            gemini_chat = genai_client.chats.create(
-                                model=APP_CONFIG["gemini"]["model"],
-                                config=types.GenerateContentConfig(system_instruction=APP_CONFIG["system_instruction"],tools=tools,response_mime_type="text/plain",max_output_tokens=APP_CONFIG["gemini"]["max_output_tokens"],temperature=APP_CONFIG["gemini"]["model_temp"]),
-                                history=get_interactions(25),
-                            )
-                            applistmain = [(a["name"], a["code"]) for a in (__import__("json").loads(SYSTEM_CONFIG["APP_LIST"])["apps"] if SYSTEM_CONFIG.get("APP_LIST") else [])] or None
-                            if homeassistent:
-                                # Get actual HA data for commands
-                                ha_data_raw = get_value_by_id('HA_DATA')
-                                if ha_data_raw:
-                                    try:
-                                        ha_data = json.loads(ha_data_raw)
-                                        command = generate_home_assistant_commands(ha_data.get('url', 'http://localhost:8123'), ha_data.get('token', ''))
-                                    except:
-                                        command = "home assistant commands are not available (invalid configuration)"
-                                else:
-                                    command = "home assistant commands are not available (no configuration)"
-                            else:
-                                command = "home assistant commands are not available"
-                            setup_message = f"::SYSTEM2D2F4G5S3D:: No need to reply on this message. this is a system message, it contains the user and system information. \n User's name is {APP_CONFIG['user']['name']}\nlist of apps that can be opened by you and their codes. \n {applistmain}\n These are the avalable home assistant commands to control devises: \n {command}"
-                            gemini_chat.send_message(setup_message)
-                            # printf"\n\nsetup message is : \n {setup_message}")
-                    if uploaded_files:
+                    homeassistent = settings.get_bool('HAEnabled')
+                    if not context_cache.keep_alive(genai_client):
+                        # The cached prefix this session was built on is gone
+                        chat_sessions.reset()
+                    # Usually already built by the warm-up started in main_entry
+                    gemini_chat = chat_sessions.get()
+                    only_text_files = all(isinstance(part, str) for part in uploaded_files)
+                    if uploaded_files and (app_config_variables["attachment_mode"] == "single" or only_text_files):
+                        # One round trip: the file parts ride along with the user's text
+                        # (inline text needs no separate analysis in either mode)
+                        response_text = send_chat_message(uploaded_files + [(user_message or "What are these files about?") + failure_note], stream_id, cancel_token)
+                    elif uploaded_files:
                         # print"Using generate_content for file processing")
                         contents = []
                     
@@ -1143,22 +1486,27 @@ class API:
                             types.Tool(google_search=types.GoogleSearch()),
                             types.Tool(url_context=types.UrlContext()),
                         ]
-                        genai_config = types.GenerateContentConfig(system_instruction=APP_CONFIG["system_instruction"],tools=tools,response_mime_type="text/plain",max_output_tokens=APP_CONFIG["gemini"]["max_output_tokens"],temperature=APP_CONFIG["gemini"]["model_temp"])
-                        response = genai_client.models.generate_content(
-                            model=APP_CONFIG["gemini"]["model"],
-                            contents=contents,
-                            config=genai_config
-                        )
-                        response_text = response.text
-                        response = gemini_chat.send_message(f"::SYSTEM2D2F4G5S3D:: reply based on the file analysis and user message [File Analysis - {response_text} ] {user_message if user_message else 'User message: What are these files about?'}")
-                        response_text = response.text
+                        genai_config = types.GenerateContentConfig(http_options=gemini_http_options(),system_instruction=APP_CONFIG["system_instruction"],tools=tools,response_mime_type="text/plain",max_output_tokens=APP_CONFIG["gemini"]["max_output_tokens"],temperature=APP_CONFIG["gemini"]["model_temp"])
+                        # The same files were analyzed before: skip the extra model call
+                        response_text = attachment_cache.get_analysis(file_digests)
+                        if response_text is None:
+                            response = gemini_calls.call(
+                                genai_client.models.generate_content,
+                                model=APP_CONFIG["gemini"]["model"],
+                                contents=contents,
+                                config=genai_config,
+                                kind="analysis", idempotent=True, cancel_token=cancel_token,
+                            )
+                            response_text = response.text
+                            if response_text:
+                                attachment_cache.put_analysis(file_digests, response_text)
+                        cancel_token.check()
+                        response_text = send_chat_message(f"::SYSTEM2D2F4G5S3D:: reply based on the file analysis and user message [File Analysis - {response_text} ] {user_message if user_message else 'User message: What are these files about?'}{failure_note}", stream_id, cancel_token)
                     else:
                         # print"Using chat for text-only message")
                         # Create chat if it doesn't exist
                         # Send message and get response
-                        response = gemini_chat.send_message(user_message)
-                        # printresponse.json())
-                        response_text = response.text
+                        response_text = send_chat_message(user_message + failure_note, stream_id, cancel_token)
                     
                     
                     # printf"\n\nbefore commands check Response from Gemini API: {response_text}\n\n")
@@ -1173,15 +1521,14 @@ class API:
                         ha_token = None
                         ha_url = None
                         if homeassistent:
-                            ha_data_raw = get_value_by_id('HA_DATA')
-                            if ha_data_raw:
-                                try:
-                                    ha_data = json.loads(ha_data_raw)
+                            try:
+                                ha_data = settings.get_json('HA_DATA')
+                                if ha_data:
                                     ha_token = ha_data.get('token')
                                     ha_url = ha_data.get('url')
-                                except:
-                                    show_native_error_box('error', "Failed to parse HA data for commands_check")
-                                    # print"Failed to parse HA data for commands_check")
+                            except:
+                                show_native_error_box('error', "Failed to parse HA data for commands_check")
+                                # print"Failed to parse HA data for commands_check")
                         
                         if response_text:
                             # Store original response with commands for database
@@ -1259,8 +1606,11 @@ class API:
 
                     # printf"Response from Gemini API: {response_text[:100]}...")
                     # Save original response with commands to database
-                    insert_into_db("model", original_response_with_commands)
-                    insert_into_db("user", user_message)
+                    interaction_writer.submit([("model", original_response_with_commands), ("user", user_message)])
+                    conversation_summarizer.schedule()
+                    if history_tokens(gemini_chat.get_history()[getattr(gemini_chat, "seed_turns", 0):], attachment_tokens) > app_config_variables["context_token_limit"]:
+                        # Rebuild from the database with a trimmed history while the user reads the reply
+                        chat_sessions.reset(warm=True)
                     try:
                         if APP_CONFIG["user-type"] == "pro" and isvoiseactive:
                             if len(clean_response_for_frontend) < 4900:
@@ -1320,9 +1670,16 @@ class API:
                 except Exception as e:
                     # printf"Error calling Gemini API: {e}")
                     # Fallback response in case of API error
+                    if isinstance(e, CircuitOpenError):
+                        # Failing fast: the service is degraded, not this request
+                        text = str(e)
+                    elif isinstance(e, CallTimeout):
+                        text = f"{error_message} The AI service took too long to answer, please try again."
+                    else:
+                        text = f"{error_message} Error details: {str(e)}"
                     reply = {
                         "sender": "Emily AI",
-                        "text": f"{error_message} Error details: {str(e)}",
+                        "text": text,
                         "isUser": False
                     }
                     if window:
@@ -1409,6 +1766,43 @@ class API:
             if window:
                 window.evaluate_js("handleNativeFileSelect(null, null)")
 
+    def pick_attachments(self, file_type: str = "document") -> Dict[str, Any]:
+        """
+        Let the user pick files with the native dialog and return handles for them.
+
+        Only the handle, name and size go back to the frontend; the content
+        is read from disk when the message is sent.
+        """
+        if not window:
+            return {"success": False, "message": "Window not available"}
+        allowed_extensions = APP_CONFIG["allowed_extensions"].get(file_type, [])
+        file_types = ()
+        if allowed_extensions:
+            # pywebview parses each filter from a 'Description (*.a;*.b)' string
+            file_types = (f"{file_type.capitalize()} files ({';'.join(f'*{ext}' for ext in allowed_extensions)})",)
+        try:
+            result = window.create_file_dialog(webview.OPEN_DIALOG, allow_multiple=True, file_types=file_types)
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+        if not result:
+            return {"success": False, "message": "No file selected"}
+        files = []
+        for path in result:
+            extension = os.path.splitext(path)[1].lower()
+            error = None
+            if extension not in allowed_extensions:
+                error = f"Invalid file type for {os.path.basename(path)}. Allowed extensions for {file_type}: {', '.join(allowed_extensions)}"
+            elif os.path.getsize(path) > app_config_variables["attachment_max_bytes"]:
+                error = f"File {os.path.basename(path)} exceeds {app_config_variables['attachment_max_bytes'] // (1024 * 1024)}MB limit. Please choose a smaller file."
+            if error:
+                for info in files:
+                    attachments.release(info["handle"])
+                return {"success": False, "message": error}
+            info = attachments.register(path)
+            info["mimeType"] = ATTACHMENT_MIME_TYPES.get(extension.lstrip('.'), "")
+            files.append(info)
+        return {"success": True, "files": files}
+
     def file_upload(self, file_type=None):
         """
         Alternative method for file uploading - simpler approach
@@ -1533,6 +1927,7 @@ def main():
     
     # Initialize the API instance
     api_instance = API()
+    maintenance_scheduler.start()
     
     # Create window with HTML file
     # print"Creating PyWebView window...")
@@ -1626,9 +2021,11 @@ def main_check():
         result = show_login_window(api_uris['login_api'], device_id)
         if result and result.get('success'):
             # print"Login successful!", result['data'])
-            add_record('session_token', result['data']['session_token'])
-            add_record('refresh_token', result['data']['refresh_token'])
-            add_record('user_id', result['data']['user_id'])
+            set_many({
+                'session_token': result['data']['session_token'],
+                'refresh_token': result['data']['refresh_token'],
+                'user_id': result['data']['user_id']
+            })
             # print"Session data saved successfully.")
             show_success_box('Login Successful', 'You have successfully logged in. Restarting Application...')
             startup()
@@ -0,0 +1,70 @@
+import hashlib
+import time
+
+from modules import storage
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: str) -> str:
+    """Hash a file in 1 MB chunks so large documents never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class AttachmentCache:
+    """
+    Remembers attachments by the SHA-256 of their content.
+
+    For an upload it stores the remote file's name, URI, MIME type and
+    expiry, so attaching the same file again reuses the remote copy while
+    it is valid (with `expiry_margin` seconds to spare). It also stores the
+    model's analysis of a set of files, keyed on their hashes, so the
+    analysis call is skipped when the same files come back.
+
+    Rows are evicted least recently used first once the cache holds more
+    than `max_bytes` of stored data or `max_entries` rows; expired uploads
+    without an analysis are dropped at the same time.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_entries: int = 500, expiry_margin: int = 600):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+
+    def get_upload(self, digest: str):
+        """Return {"remote_name", "uri", "mime_type"} for a still-valid upload, else None."""
+        row = storage.get_attachment_cache("file:" + digest, time.time())
+        if not row or not row["uri"]:
+            return None
+        if row["expires_at"] is not None and row["expires_at"] - self.expiry_margin < time.time():
+            return None
+        return {"remote_name": row["remote_name"], "uri": row["uri"], "mime_type": row["mime_type"]}
+
+    def put_upload(self, digest: str, remote_name, uri, mime_type, expires_at=None):
+        """Remember an uploaded file; `expires_at` is a Unix timestamp."""
+        storage.put_attachment_cache("file:" + digest, time.time(), remote_name=remote_name, uri=uri,
+                                     mime_type=mime_type, expires_at=expires_at)
+        self.evict()
+
+    @staticmethod
+    def analysis_key(digests) -> str:
+        return "analysis:" + hashlib.sha256("\n".join(sorted(digests)).encode("ascii")).hexdigest()
+
+    def get_analysis(self, digests):
+        row = storage.get_attachment_cache(self.analysis_key(digests), time.time())
+        return row["analysis"] if row else None
+
+    def put_analysis(self, digests, analysis: str):
+        storage.put_attachment_cache(self.analysis_key(digests), time.time(), analysis=analysis)
+        self.evict()
+
+    def evict(self) -> int:
+        return storage.evict_attachment_cache(self.max_bytes, self.max_entries, time.time())
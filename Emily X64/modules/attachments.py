@@ -0,0 +1,50 @@
+import os
+import secrets
+import threading
+from typing import Dict, Optional
+
+# Prefix of the `data` field for attachments picked through the native
+# dialog; the rest is a handle the backend resolves to the file on disk
+ATTACHMENT_PREFIX = "attachment:"
+
+
+class AttachmentRegistry:
+    """
+    Maps opaque handles to files the user picked in the native file dialog.
+
+    The frontend only ever sees the handle, so it cannot make the backend
+    read an arbitrary path, and the file itself never crosses the JS
+    bridge: uploads stream it straight from disk.
+    """
+
+    def __init__(self):
+        self._files: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, path: str) -> Dict[str, object]:
+        """Remember `path` and return {"handle", "name", "size"} for the frontend."""
+        handle = secrets.token_hex(12)
+        with self._lock:
+            self._files[handle] = path
+        return {
+            "handle": ATTACHMENT_PREFIX + handle,
+            "name": os.path.basename(path),
+            "size": os.path.getsize(path),
+        }
+
+    @staticmethod
+    def is_reference(data) -> bool:
+        return isinstance(data, str) and data.startswith(ATTACHMENT_PREFIX)
+
+    def resolve(self, reference: str) -> Optional[str]:
+        """Return the path for a handle (with or without the prefix), or None."""
+        if reference.startswith(ATTACHMENT_PREFIX):
+            reference = reference[len(ATTACHMENT_PREFIX):]
+        with self._lock:
+            return self._files.get(reference)
+
+    def release(self, reference: str):
+        if reference.startswith(ATTACHMENT_PREFIX):
+            reference = reference[len(ATTACHMENT_PREFIX):]
+        with self._lock:
+            self._files.pop(reference, None)
@@ -0,0 +1,72 @@
+import threading
+
+
+class ChatSessionManager:
+    """
+    Owns the Gemini chat session and builds it ahead of time.
+
+    warm_up() runs `factory` on a background thread (e.g. while the loader
+    is still on screen) so the first message finds the session ready. get()
+    returns the session, waiting for a warm-up in progress, or builds it
+    inline if there was none or it failed. reset() drops the session; a
+    warm-up that was still running for the old one is discarded.
+
+    :param factory: callable returning a new chat session.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._session = None
+        self._generation = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_error = None
+
+    def warm_up(self):
+        """Start building the session in the background (no-op if built or building)."""
+        with self._lock:
+            if self._session is not None or (self._thread and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._build, args=(self._generation,),
+                                            name="chat-warmup", daemon=True)
+            self._thread.start()
+
+    def _build(self, generation):
+        try:
+            session = self._factory()
+        except Exception as e:
+            # get() retries inline and reports the error to the user then
+            self.last_error = e
+            return
+        with self._lock:
+            if generation == self._generation and self._session is None:
+                self._session = session
+                self.last_error = None
+
+    def get(self, timeout=None):
+        """Return the chat session, building it now if the warm-up did not."""
+        thread = self._thread
+        if self._session is None and thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        with self._lock:
+            if self._session is not None:
+                return self._session
+            generation = self._generation
+        session = self._factory()
+        with self._lock:
+            if generation == self._generation and self._session is None:
+                self._session = session
+            return self._session or session
+
+    @property
+    def current(self):
+        """The session if it is already built, else None; never blocks."""
+        return self._session
+
+    def reset(self, warm=False):
+        """Forget the current session; with `warm`, start building a new one."""
+        with self._lock:
+            self._generation += 1
+            self._session = None
+        if warm:
+            self.warm_up()
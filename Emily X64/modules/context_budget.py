@@ -0,0 +1,100 @@
+import math
+import re
+
+# Rough English average for Gemini's tokenizer; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Role marker and turn framing added around every message
+MESSAGE_OVERHEAD = 4
+# Gemini bills an image (or PDF page) as 258 tokens; used for any non-text part
+# whose size is unknown
+FILE_PART_TOKENS = 258
+# PDFs whose page objects can't be found (compressed object streams) are
+# assumed to have one page per this many bytes
+PDF_BYTES_PER_PAGE = 60 * 1024
+TEXT_MIME_TYPES = {"application/x-javascript", "application/x-python", "application/rtf"}
+_PDF_PAGE = re.compile(rb"/Type\s{0,8}/Page(?![A-Za-z])")
+
+
+def estimate_tokens(text) -> int:
+    """Estimate the token count of a string (chars / 4, rounded up)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_pdf_pages(stream, chunk_size: int = 1024 * 1024) -> int:
+    """Count the page objects of a PDF read from a binary stream in chunks; 0 if none are visible."""
+    pages = 0
+    tail = b""
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        data = tail + chunk
+        # A match is under 32 bytes: count those starting before the cut, rescan the rest next round
+        cut = max(0, len(data) - 32)
+        pages += sum(1 for match in _PDF_PAGE.finditer(data) if match.start() < cut)
+        tail = data[cut:]
+    return pages + len(_PDF_PAGE.findall(tail))
+
+
+def estimate_file_tokens(mime_type: str, size: int, pages: int = 0) -> int:
+    """
+    Estimate what an attached file costs in the context.
+
+    PDFs are billed per page (`pages`, else guessed from the size), text
+    files by their length, images and anything else as FILE_PART_TOKENS.
+    """
+    if mime_type == "application/pdf":
+        return (pages or max(1, math.ceil(size / PDF_BYTES_PER_PAGE))) * FILE_PART_TOKENS
+    if mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES:
+        return max(1, math.ceil(size / CHARS_PER_TOKEN))
+    return FILE_PART_TOKENS
+
+
+def _file_uri(part):
+    file_data = part.get("file_data") if isinstance(part, dict) else getattr(part, "file_data", None)
+    if file_data is None:
+        return None
+    return file_data.get("file_uri") if isinstance(file_data, dict) else getattr(file_data, "file_uri", None)
+
+
+def message_tokens(message, file_tokens=None) -> int:
+    """
+    Estimate the tokens of one history message.
+
+    Accepts the dict form used by storage.get_interactions()
+    ({"role": ..., "parts": [{"text": ...}]}) or a genai Content object.
+    Non-text parts (attached files) cost `file_tokens[file_uri]` when the
+    estimate for that upload is known (see estimate_file_tokens), else
+    FILE_PART_TOKENS.
+    """
+    parts = message.get("parts") if isinstance(message, dict) else getattr(message, "parts", None)
+    total = MESSAGE_OVERHEAD
+    for part in parts or []:
+        text = part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+        if text is not None:
+            total += estimate_tokens(text)
+        else:
+            total += (file_tokens or {}).get(_file_uri(part), FILE_PART_TOKENS)
+    return total
+
+
+def history_tokens(messages, file_tokens=None) -> int:
+    return sum(message_tokens(message, file_tokens) for message in messages)
+
+
+def fit_history(messages, budget: int, min_messages: int = 2):
+    """
+    Return the longest leading run of `messages` that fits in `budget` tokens.
+
+    `messages` is newest first, as returned by storage.get_interactions(), so
+    the most recent turns are kept. At least `min_messages` are kept even if
+    they alone exceed the budget, so the latest exchange is never dropped.
+    """
+    kept = []
+    used = 0
+    for message in messages:
+        cost = message_tokens(message)
+        if used + cost > budget and len(kept) >= min_messages:
+            break
+        kept.append(message)
+        used += cost
+    return kept
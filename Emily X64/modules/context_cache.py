@@ -0,0 +1,128 @@
+import hashlib
+import json
+import threading
+import time
+
+
+def cache_key(*parts) -> str:
+    """SHA-256 over the pieces that make up a cached prefix."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ContextCache:
+    """
+    Tracks the Gemini cached-content entry that holds the static prompt prefix.
+
+    The cache name, its key (hash of model, instruction, app list and HA
+    catalog) and its expiry are kept in the settings table, so restarts
+    reuse a live cache instead of creating and paying for a new one. The
+    entry is only recreated when the key changes or the cache has expired;
+    a cache close to expiry gets its TTL extended instead.
+
+    Any failure (model without caching support, prefix below the minimum
+    size, network) makes get() return None and the caller falls back to
+    sending the prefix uncached. A key that failed is not retried until
+    the app restarts.
+
+    :param settings: SettingsStore used to persist the entry.
+    :param ttl_seconds: lifetime requested for new or refreshed caches.
+    :param refresh_margin: extend the TTL when fewer seconds than this remain.
+    """
+
+    SETTING_KEY = 'geminiContextCache'
+
+    def __init__(self, settings, ttl_seconds: int = 3600, refresh_margin: int = 300):
+        self.settings = settings
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.active_name = None
+        self.last_error = None
+        self._failed_keys = set()
+        self._lock = threading.Lock()
+
+    def _entry(self):
+        try:
+            return self.settings.get_json(self.SETTING_KEY)
+        except ValueError:
+            return None
+
+    def _save(self, key, name):
+        entry = {"key": key, "name": name, "expires": time.time() + self.ttl_seconds}
+        self.settings.set(self.SETTING_KEY, json.dumps(entry))
+        return entry
+
+    def _refresh(self, client, entry) -> bool:
+        try:
+            client.caches.update(name=entry["name"], config={"ttl": f"{self.ttl_seconds}s"})
+        except Exception as e:
+            self.last_error = e
+            return False
+        self._save(entry["key"], entry["name"])
+        return True
+
+    def get(self, client, key, create):
+        """
+        Return the cache name for `key`, or None to send the prefix uncached.
+
+        `create(ttl)` must create the cache (client.caches.create) and return it.
+        """
+        with self._lock:
+            entry = self._entry()
+            now = time.time()
+            if entry and entry.get("key") == key and entry.get("expires", 0) > now:
+                if entry["expires"] - now > self.refresh_margin or self._refresh(client, entry):
+                    self.active_name = entry["name"]
+                    return self.active_name
+            if key in self._failed_keys:
+                self.active_name = None
+                return None
+            try:
+                cache = create(f"{self.ttl_seconds}s")
+            except Exception as e:
+                self.last_error = e
+                self._failed_keys.add(key)
+                self.active_name = None
+                return None
+            if entry and entry.get("name") and entry["name"] != cache.name:
+                try:
+                    # Stop paying storage for the superseded prefix
+                    client.caches.delete(name=entry["name"])
+                except Exception:
+                    pass
+            self._save(key, cache.name)
+            self.active_name = cache.name
+            return self.active_name
+
+    def keep_alive(self, client) -> bool:
+        """
+        Extend the active cache if it is about to expire.
+
+        Returns False if the session's cache has expired or could not be
+        refreshed; the chat session must then be rebuilt.
+        """
+        with self._lock:
+            if self.active_name is None:
+                return True
+            entry = self._entry()
+            if not entry or entry.get("name") != self.active_name:
+                return False
+            remaining = entry.get("expires", 0) - time.time()
+            if remaining > self.refresh_margin:
+                return True
+            return remaining > 0 and self._refresh(client, entry)
+
+    def clear(self, client=None):
+        """Forget (and if possible delete) the stored cache."""
+        with self._lock:
+            entry = self._entry()
+            if client and entry and entry.get("name"):
+                try:
+                    client.caches.delete(name=entry["name"])
+                except Exception:
+                    pass
+            self.settings.delete(self.SETTING_KEY)
+            self.active_name = None
@@ -0,0 +1,187 @@
+import csv
+import io
+import itertools
+import math
+import random
+from collections import Counter
+
+# Values treated as missing
+NULL_VALUES = {"", "na", "n/a", "nan", "null", "none", "-"}
+BOOL_VALUES = {"true", "false", "yes", "no"}
+
+
+class ColumnStats:
+    """Running statistics for one column, merged chunk by chunk."""
+
+    def __init__(self, name, top_k_capacity):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.numeric = 0
+        self.integers = 0
+        self.bools = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.max_length = 0
+        self.top = Counter()
+        self.top_capacity = top_k_capacity
+        self.top_approximate = False
+
+    def add_chunk(self, values):
+        self.count += len(values)
+        present = [v.strip() for v in values]
+        present = [v for v in present if v.lower() not in NULL_VALUES]
+        self.nulls += len(values) - len(present)
+        if not present:
+            return
+        self.max_length = max(self.max_length, max(map(len, present)))
+        self.bools += sum(1 for v in present if v.lower() in BOOL_VALUES)
+        try:
+            # Fast path: the whole chunk parses in one C-level pass
+            numbers = list(map(float, present))
+            others = ()
+        except ValueError:
+            numbers = []
+            others = []
+            for v in present:
+                try:
+                    numbers.append(float(v))
+                except ValueError:
+                    others.append(v)
+        numbers = [n for n in numbers if math.isfinite(n)]
+        if numbers:
+            self._merge_numbers(numbers)
+            self.integers += sum(1 for n in numbers if n.is_integer())
+        # Numbers are described by their statistics; only count the rest
+        self.top.update(others)
+        if len(self.top) > self.top_capacity:
+            # Keep memory bounded on high-cardinality columns; counts become lower bounds
+            self.top = Counter(dict(self.top.most_common(self.top_capacity // 2)))
+            self.top_approximate = True
+
+    def _merge_numbers(self, numbers):
+        # Chan et al. parallel variance: combine this chunk's moments with the running ones
+        n_b = len(numbers)
+        mean_b = math.fsum(numbers) / n_b
+        m2_b = math.fsum((x - mean_b) ** 2 for x in numbers)
+        n_a = self.numeric
+        total = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / total
+        self.m2 += m2_b + delta * delta * n_a * n_b / total
+        self.numeric = total
+        low, high = min(numbers), max(numbers)
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    @property
+    def present(self):
+        return self.count - self.nulls
+
+    @property
+    def dtype(self) -> str:
+        if not self.present:
+            return "empty"
+        if self.numeric == self.present:
+            return "integer" if self.integers == self.numeric else "float"
+        if self.bools == self.present:
+            return "boolean"
+        if self.numeric >= 0.9 * self.present:
+            return "mostly numeric"
+        return "text"
+
+    def describe(self, top_values: int) -> str:
+        line = f"- **{self.name}** ({self.dtype}): {self.present:,} values, {self.nulls:,} missing"
+        if self.numeric:
+            std = math.sqrt(self.m2 / (self.numeric - 1)) if self.numeric > 1 else 0.0
+            line += f"; min {self.minimum:g}, max {self.maximum:g}, mean {self.mean:.6g}, std {std:.6g}"
+        if self.top:
+            approx = "~" if self.top_approximate else ""
+            label = "non-numeric" if self.numeric else "distinct"
+            distinct = f"{'>' if self.top_approximate else ''}{len(self.top):,} {label}"
+            common = ", ".join(f"{value[:40]!r} ({approx}{n:,})" for value, n in self.top.most_common(top_values))
+            line += f"; {distinct}; top: {common}"
+        return line
+
+
+def profile_csv(stream, chunk_rows: int = 50_000, sample_rows: int = 20, top_values: int = 5,
+                top_k_capacity: int = 5_000, max_columns: int = 200, seed: int = 0) -> str:
+    """
+    Summarize a CSV as a compact markdown profile.
+
+    `stream` is a text stream opened with newline=''. Rows are read in chunks
+    of `chunk_rows` and each chunk is processed column by column, so memory
+    depends on the chunk size and column count, not on the file length. The
+    profile lists the schema with inferred types, per-column statistics,
+    the most common values, and a uniform random sample of rows (reservoir
+    sampling).
+    """
+    sniff = stream.read(64 * 1024)
+    try:
+        dialect = csv.Sniffer().sniff(sniff, delimiters=",;\t|")
+    except csv.Error:
+        # Too little to sniff: take the separator that is most common in the header
+        first_line = sniff.split("\n", 1)[0]
+        dialect = csv.excel
+        delimiter = max(",;\t|", key=first_line.count)
+        if first_line.count(delimiter):
+            dialect = type("SniffedDialect", (csv.excel,), {"delimiter": delimiter})
+    reader = csv.reader(_replay(sniff, stream), dialect)
+    header = next(reader, None)
+    if header is None:
+        return "The CSV file is empty."
+    header = [h.strip() or f"column_{i + 1}" for i, h in enumerate(header)][:max_columns]
+    width = len(header)
+    columns = [ColumnStats(name, top_k_capacity) for name in header]
+    rng = random.Random(seed)
+    sample = []
+    rows_seen = 0
+    ragged = 0
+    while True:
+        chunk = list(itertools.islice(reader, chunk_rows))
+        if not chunk:
+            break
+        for row in chunk:
+            if len(row) != width:
+                ragged += 1
+                row[:] = (row + [""] * width)[:width]
+            rows_seen += 1
+            if len(sample) < sample_rows:
+                sample.append(row)
+            else:
+                slot = rng.randrange(rows_seen)
+                if slot < sample_rows:
+                    sample[slot] = row
+        for stats, values in zip(columns, zip(*chunk)):
+            stats.add_chunk(values)
+
+    lines = [f"CSV profile: {rows_seen:,} rows x {width} columns (delimiter {dialect.delimiter!r})."]
+    if ragged:
+        lines.append(f"{ragged:,} rows had a different number of fields and were padded or cut.")
+    lines.append("")
+    lines.append("Columns:")
+    lines.extend(stats.describe(top_values) for stats in columns)
+    if sample:
+        lines.append("")
+        lines.append(f"Random sample of {len(sample)} rows:")
+        lines.append("| " + " | ".join(header) + " |")
+        lines.append("|" + "---|" * width)
+        for row in sample:
+            lines.append("| " + " | ".join(v.replace("|", "\\|").replace("\r", "").replace("\n", " ")[:60] for v in row) + " |")
+    return "\n".join(lines)
+
+
+def _replay(prefix, stream):
+    """Yield the sniffed prefix followed by the rest of the stream, as lines."""
+    rest = stream.readline()
+    # Split like the stream itself (newline=''): only at \n, \r and \r\n, never
+    # at the form feeds or Unicode separators str.splitlines() also breaks on
+    yield from io.StringIO(prefix + rest, newline='')
+    yield from stream
+
+
+def head_lines(stream, rows: int) -> str:
+    """The header plus the first `rows` lines of a text stream, for a trimmed preview."""
+    return "".join(itertools.islice(stream, rows + 1))
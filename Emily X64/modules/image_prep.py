@@ -0,0 +1,56 @@
+import io
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; images are then uploaded as-is
+    Image = None
+    ImageOps = None
+
+# Output format per source: photos become JPEG, images with transparency WebP
+OPAQUE_FORMAT = ("JPEG", "image/jpeg")
+ALPHA_FORMAT = ("WEBP", "image/webp")
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def prepare_image(data: bytes, max_dimension: int = 1536, quality: int = 85) -> Optional[Tuple[bytes, str]]:
+    """
+    Downscale and re-encode an image before upload.
+
+    The image is rotated according to its EXIF orientation, shrunk so its
+    longest side is at most `max_dimension`, and saved without metadata
+    (EXIF, GPS, ICC) as JPEG, or WebP if it has transparency. Returns
+    (bytes, mime_type), or None to upload the original: Pillow missing,
+    unreadable or animated image, or no saving.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so
+    several images can be prepared in parallel threads.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if getattr(img, "is_animated", False):
+                return None
+            resized = max(img.size) > max_dimension
+            # JPEG only: decode at a reduced DCT scale that is still large enough
+            img.draft("RGB", (max_dimension, max_dimension))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+            fmt, mime_type = ALPHA_FORMAT if has_alpha else OPAQUE_FORMAT
+            img = img.convert("RGBA" if has_alpha else "RGB")
+            out = io.BytesIO()
+            options = {"quality": quality}
+            if fmt == "JPEG":
+                options["optimize"] = True
+            img.save(out, fmt, **options)
+    except Exception:
+        return None
+    result = out.getvalue()
+    if not resized and len(result) >= len(data):
+        return None
+    return result, mime_type
@@ -0,0 +1,94 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from modules import storage
+
+
+class MaintenanceScheduler:
+    """
+    Runs history retention and database housekeeping while the app is idle.
+
+    Call touch() whenever the user does something; once nothing has happened
+    for `idle_seconds` and the last run is older than `interval_hours`, the
+    scheduler archives cold turns and runs storage.run_maintenance() on a
+    background thread. Retention limits are read from the settings store on
+    every run so changes apply without a restart.
+
+    :param settings: SettingsStore used for overrides and the last-run time.
+    :param defaults: dict with history_hot_rows, history_min_hot_rows,
+        history_retention_days, maintenance_idle_seconds and
+        maintenance_interval_hours.
+    :param before_run: optional callable run first (e.g. flushing queued writes).
+    """
+
+    LAST_RUN_KEY = 'lastMaintenance'
+
+    def __init__(self, settings, defaults, before_run=None):
+        self.settings = settings
+        self.defaults = defaults
+        self.before_run = before_run
+        self.last_report = None
+        self._last_activity = time.monotonic()
+        self._run_lock = threading.Lock()
+        self._thread = None
+
+    def touch(self):
+        """Record user activity; maintenance waits until the app is idle again."""
+        self._last_activity = time.monotonic()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="db-maintenance", daemon=True)
+            self._thread.start()
+
+    def _setting(self, key, default_key):
+        value = self.settings.get(key)
+        try:
+            return int(value) if value is not None else int(self.defaults[default_key])
+        except ValueError:
+            return int(self.defaults[default_key])
+
+    def _idle(self) -> bool:
+        return time.monotonic() - self._last_activity >= self.defaults['maintenance_idle_seconds']
+
+    def _due(self) -> bool:
+        last_run = self.settings.get(self.LAST_RUN_KEY)
+        if not last_run:
+            return True
+        try:
+            elapsed = datetime.now() - datetime.fromisoformat(last_run)
+        except ValueError:
+            return True
+        return elapsed >= timedelta(hours=self.defaults['maintenance_interval_hours'])
+
+    def _loop(self):
+        while True:
+            time.sleep(min(30, self.defaults['maintenance_idle_seconds']))
+            if self._idle() and self._due():
+                try:
+                    self.run_now()
+                except Exception:
+                    # Never take the app down for housekeeping; retry next interval
+                    self.settings.set(self.LAST_RUN_KEY, datetime.now().isoformat())
+
+    def run_now(self, force=False):
+        """Archive cold turns and tidy both databases; returns a report dict, or None if a run is already in progress."""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            if self.before_run:
+                self.before_run()
+            keep_rows = self._setting('historyHotRows', 'history_hot_rows')
+            retention_days = self._setting('historyRetentionDays', 'history_retention_days')
+            older_than = None
+            if retention_days > 0:
+                older_than = (datetime.now() - timedelta(days=retention_days)).isoformat()
+            archived = storage.archive_interactions(keep_rows, older_than, self.defaults['history_min_hot_rows'])
+            # VACUUM briefly locks the file; skip it if the user came back meanwhile
+            report = storage.run_maintenance() if force or self._idle() else {}
+            self.last_report = {"archived": archived, "databases": report}
+            self.settings.set(self.LAST_RUN_KEY, datetime.now().isoformat())
+            return self.last_report
+        finally:
+            self._run_lock.release()
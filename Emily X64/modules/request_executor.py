@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RequestCancelled(BaseException):
+    """
+    Raised inside a request when cancel() was called for it.
+
+    Derives from BaseException (like asyncio.CancelledError) so the broad
+    `except Exception` handlers in the chat pipeline let it through.
+    """
+
+
+class CancelToken:
+    """Passed to every request; long-running work calls check() between steps."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise RequestCancelled()
+
+
+class RequestExecutor:
+    """
+    Runs backend work off the pywebview bridge threads.
+
+    An asyncio event loop on a dedicated thread owns every request. submit()
+    returns a request ID at once; the blocking work itself (Gemini, uploads,
+    TTS) runs in a small thread pool and receives a CancelToken as its first
+    argument. Requests that share a `session` run one at a time in submission
+    order, so two chat turns never use the same Gemini chat concurrently.
+
+    When a request ends, on_done(request_id, status, error) is called with
+    status "done", "cancelled" or "error".
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._max_workers = max_workers
+        self._ids = itertools.count(1)
+        self._requests = {}
+        self._session_locks = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="backend-loop", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.set_default_executor(ThreadPoolExecutor(self._max_workers, thread_name_prefix="backend-request"))
+        self._ready.set()
+        self._loop.run_forever()
+
+    def submit(self, func, *args, session=None, on_done=None) -> str:
+        """Schedule func(cancel_token, *args) and return its request ID."""
+        self.start()
+        request_id = f"req-{next(self._ids)}"
+        token = CancelToken()
+        with self._lock:
+            # Registered before scheduling so cancel()/wait() can always find it
+            self._requests[request_id] = (token, None)
+            future = asyncio.run_coroutine_threadsafe(
+                self._execute(request_id, token, func, args, session, on_done), self._loop)
+            self._requests[request_id] = (token, future)
+        return request_id
+
+    def cancel(self, request_id) -> bool:
+        """
+        Ask a request to stop; False if it is unknown or already finished.
+
+        Work already running stops at its next token.check(); a request still
+        waiting for its session starts, sees the flag and ends immediately.
+        """
+        with self._lock:
+            entry = self._requests.get(request_id)
+        if entry is None:
+            return False
+        entry[0].cancel()
+        return True
+
+    def wait(self, request_id, timeout=None):
+        """Block until a request has finished (no-op if it already has)."""
+        with self._lock:
+            entry = self._requests.get(request_id)
+        if entry is not None:
+            entry[1].result(timeout)
+
+    def active(self):
+        with self._lock:
+            return list(self._requests)
+
+    def _session_lock(self, session):
+        lock = self._session_locks.get(session)
+        if lock is None:
+            lock = self._session_locks[session] = asyncio.Lock()
+        return lock
+
+    async def _execute(self, request_id, token, func, args, session, on_done):
+        loop = asyncio.get_running_loop()
+        status, error = "done", None
+        try:
+            if session is None:
+                await loop.run_in_executor(None, func, token, *args)
+            else:
+                async with self._session_lock(session):
+                    token.check()
+                    await loop.run_in_executor(None, func, token, *args)
+        except RequestCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status, error = "error", e
+        finally:
+            with self._lock:
+                self._requests.pop(request_id, None)
+        if on_done:
+            try:
+                await loop.run_in_executor(None, on_done, request_id, status, error)
+            except Exception:
+                pass
@@ -0,0 +1,345 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+try:
+    import httpx
+except ImportError:  # Only used to recognise network errors raised by the genai SDK
+    httpx = None
+
+# HTTP statuses worth retrying: timeouts, rate limits and server-side failures
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"The AI service is having trouble right now. Please try again in {max(1, round(retry_after))} seconds.")
+
+
+class CallTimeout(TimeoutError):
+    pass
+
+
+def is_transient(error) -> bool:
+    """True for failures that say nothing about the request itself (genai APIError codes, network errors, timeouts)."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in TRANSIENT_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return httpx is not None and isinstance(error, httpx.TransportError)
+
+
+class RetryBudget:
+    """
+    Token bucket that caps retries and hedged requests to a share of traffic.
+
+    Every call deposits `ratio` tokens and tokens also trickle in at
+    `refill_per_second`, up to `max_tokens`; each retry or hedge spends
+    one. During an outage the extra load stays around `ratio` of the
+    normal load instead of multiplying it by the attempt count.
+    """
+
+    def __init__(self, ratio: float = 0.2, refill_per_second: float = 0.1, max_tokens: float = 10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.refill_per_second = refill_per_second
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._tokens = max_tokens
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, amount=0.0):
+        now = self._clock()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.refill_per_second + amount)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful calls, for the hedging threshold."""
+
+    def __init__(self, window: int = 100, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile of recent latencies, or None until there are enough samples."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the backend is down.
+
+    After `failure_threshold` transient failures in a row the circuit
+    opens and calls raise CircuitOpenError for `reset_timeout` seconds.
+    Then one probe call is let through (half open): success closes the
+    circuit, failure opens it again. on_state_change(state) is called on
+    every transition so the UI can show the backend status.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, on_state_change=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go to the backend now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - self._clock()
+            if self._state == self.OPEN and remaining > 0:
+                raise CircuitOpenError(remaining)
+            if self._probing:
+                # Someone else's probe is in flight; wait for its verdict
+                raise CircuitOpenError(1.0)
+            self._probing = True
+            changed = self._set_state(self.HALF_OPEN)
+        self._notify(changed)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            changed = self._set_state(self.CLOSED)
+        self._notify(changed)
+
+    def release(self):
+        """A call ended without a verdict (cancelled); let the next one probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            changed = None
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._probing = False
+                changed = self._set_state(self.OPEN)
+        self._notify(changed)
+
+    def _set_state(self, state):
+        if state == self._state:
+            return None
+        self._state = state
+        return state
+
+    def _notify(self, state):
+        if state and self.on_state_change:
+            try:
+                self.on_state_change(state)
+            except Exception:
+                pass
+
+
+class ResilientCaller:
+    """
+    Wraps calls to the Gemini client with timeouts, retries, hedging and a
+    circuit breaker.
+
+    Each attempt runs on a worker thread and is abandoned after `timeout`
+    seconds (CallTimeout). Transient failures are retried up to
+    `max_attempts` times with full-jitter exponential backoff, as long as
+    the shared RetryBudget allows it. Calls marked `idempotent` are also
+    hedged: if no answer has arrived after the `hedge_quantile` latency of
+    recent calls of the same `kind`, a duplicate is started and the first
+    success wins.
+
+    Calls that change state (a chat send adds the turn to the chat history
+    when it succeeds) must not be duplicated, so they are not hedged and
+    not retried after a timeout, where the abandoned attempt may still
+    complete. Give each request an HTTP timeout no longer than `timeout`
+    so abandoned attempts end on their own. When an abandoned attempt or
+    a losing hedge does return, its result goes to `on_discard` (e.g. to
+    close a stream) instead of being dropped.
+
+    Everything the caller needs is passed in, so it can be exercised
+    against a local fake client.
+    """
+
+    def __init__(self, timeout: float = 60.0, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 hedge_quantile: float = 0.95, hedge_min_delay: float = 1.0, budget: RetryBudget = None,
+                 breaker: CircuitBreaker = None, latency_window: int = 100, latency_min_samples: int = 20,
+                 max_workers: int = 8, transient=is_transient):
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.transient = transient
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "rejected": 0}
+        self._latency_window = latency_window
+        self._latency_min_samples = latency_min_samples
+        self._latency = {}
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="gemini-call")
+        self._lock = threading.Lock()
+
+    def latency(self, kind: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._latency.get(kind)
+            if tracker is None:
+                tracker = self._latency[kind] = LatencyTracker(self._latency_window, self._latency_min_samples)
+            return tracker
+
+    def call(self, func, *args, kind: str = "default", idempotent: bool = False, timeout: float = None,
+             cancel_token=None, on_discard=None, **kwargs):
+        """Call func(*args, **kwargs) under the resilience policy and return its result."""
+        self._count("calls")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                result = self._attempt(func, args, kwargs, kind, idempotent, timeout or self.timeout, cancel_token, on_discard)
+            except Exception as e:
+                if not self.transient(e):
+                    # The backend answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if isinstance(e, CallTimeout):
+                    self._count("timeouts")
+                    if not idempotent:
+                        raise
+                if attempt >= self.max_attempts or not self.budget.try_withdraw():
+                    raise
+                self._backoff(attempt, cancel_token)
+                self.breaker.before_call()
+                self._count("retries")
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (RequestCancelled): says nothing about the backend
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _attempt(self, func, args, kwargs, kind, idempotent, timeout, cancel_token, on_discard):
+        tracker = self.latency(kind)
+        start = time.monotonic()
+        started = {self._pool.submit(func, *args, **kwargs): start}
+        winner = None
+        try:
+            winner, result = self._race(func, args, kwargs, tracker, idempotent, start, timeout, cancel_token, started)
+            return result
+        finally:
+            for future in started:
+                if future is not winner:
+                    future.cancel()
+                    future.add_done_callback(lambda done: self._discard(done, on_discard))
+
+    def _race(self, func, args, kwargs, tracker, idempotent, start, timeout, cancel_token, started):
+        """Wait for the attempts in `started` (adding a hedge when due); returns (future, result)."""
+        deadline = start + timeout
+        primary = next(iter(started))
+        hedge_at = None
+        if idempotent:
+            threshold = tracker.quantile(self.hedge_quantile)
+            if threshold is not None:
+                hedge_at = start + max(self.hedge_min_delay, threshold)
+        pending = set(started)
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                raise CallTimeout(f"No response within {timeout:g} seconds")
+            wake = deadline
+            if hedge_at is not None:
+                wake = min(wake, hedge_at)
+            if cancel_token is not None:
+                wake = min(wake, now + 0.1)
+            done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    tracker.record(time.monotonic() - started[future])
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future, future.result()
+                error = future.exception()
+            if cancel_token is not None:
+                cancel_token.check()
+            if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if self.budget.try_withdraw():
+                    self._count("hedges")
+                    hedge = self._pool.submit(func, *args, **kwargs)
+                    started[hedge] = time.monotonic()
+                    pending.add(hedge)
+        raise error
+
+    @staticmethod
+    def _discard(future, on_discard):
+        """Hand the result of an attempt nobody is waiting for to on_discard."""
+        if on_discard is None or future.cancelled() or future.exception() is not None:
+            return
+        try:
+            on_discard(future.result())
+        except Exception:
+            pass
+
+    def _backoff(self, attempt, cancel_token):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        end = time.monotonic() + delay
+        while True:
+            if cancel_token is not None:
+                cancel_token.check()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.1))
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
@@ -0,0 +1,194 @@
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import requests
+
+UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+# Chunks other than the last must be a multiple of this
+CHUNK_GRANULARITY = 256 * 1024
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class ResumableUploadError(Exception):
+    pass
+
+
+def parse_rfc3339(value) -> Optional[float]:
+    """Turn an API timestamp like 2025-01-01T00:00:00.123456789Z into a Unix time."""
+    if not value:
+        return None
+    value = value.rstrip("Z")
+    if "." in value:
+        value = value.split(".", 1)[0]
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def _retryable(error) -> bool:
+    """Network errors and RETRY_STATUS answers are worth another try; other HTTP errors are not."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUS
+    return True
+
+
+class ResumableUploader:
+    """
+    Uploads a file to the Gemini Files API with the resumable upload protocol.
+
+    The file is sent in `chunk_size` pieces read from disk (or a bytes
+    buffer) one at a time. When a chunk fails on a network error or a
+    retryable status, the server is asked how many bytes it has and the
+    upload continues from there after an exponential backoff with jitter,
+    so data that already arrived is never sent twice. If that query fails
+    too it is repeated with backoff; the upload never guesses an offset.
+    `max_retries` consecutive failures (chunks and queries alike) without
+    progress give up. Starting the upload session is retried the same
+    way. A cancelled `cancel_token` stops the upload between chunks and
+    during backoff.
+
+    on_progress(sent, total) is called at most every `progress_interval`
+    seconds, plus once at the end, so progress can go over the JS bridge
+    without flooding it.
+    """
+
+    def __init__(self, api_key: str, chunk_size: int = 8 * 1024 * 1024, max_retries: int = 5,
+                 backoff: float = 1.0, max_backoff: float = 30.0, timeout: float = 60.0,
+                 progress_interval: float = 0.25, session=None):
+        self.api_key = api_key
+        self.chunk_size = max(CHUNK_GRANULARITY, chunk_size // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.session = session or requests.Session()
+
+    def upload(self, source, mime_type: str, display_name: str = None,
+               on_progress: Optional[Callable[[int, int], None]] = None, cancel_token=None) -> dict:
+        """
+        Upload `source` (a path or bytes) and return the file resource
+        (name, uri, mimeType, expirationTime, ...).
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data, path, total = source, None, len(source)
+        else:
+            data, path, total = None, source, os.path.getsize(source)
+
+        upload_url = self._start(total, mime_type, display_name, cancel_token)
+        offset = 0
+        failures = 0
+        last_report = 0.0
+        f = open(path, "rb") if path else None
+        try:
+            while True:
+                if cancel_token is not None:
+                    cancel_token.check()
+                if f:
+                    f.seek(offset)
+                    chunk = f.read(self.chunk_size)
+                else:
+                    chunk = bytes(data[offset:offset + self.chunk_size])
+                last = offset + len(chunk) >= total
+                try:
+                    response = self.session.post(upload_url, data=chunk, timeout=self.timeout, headers={
+                        "Content-Length": str(len(chunk)),
+                        "X-Goog-Upload-Offset": str(offset),
+                        "X-Goog-Upload-Command": "upload, finalize" if last else "upload",
+                    })
+                    if response.status_code in RETRY_STATUS:
+                        raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    if not _retryable(e):
+                        raise ResumableUploadError(f"Upload rejected: {e}") from e
+                    failures = self._retry_wait(failures, e, cancel_token)
+                    # Resume where the server says it is; keep asking until it answers
+                    while True:
+                        try:
+                            offset, finished = self._query(upload_url)
+                            break
+                        except requests.RequestException as query_error:
+                            if not _retryable(query_error):
+                                raise ResumableUploadError(f"Upload session lost: {query_error}") from query_error
+                            failures = self._retry_wait(failures, query_error, cancel_token)
+                    if finished is not None:
+                        return finished
+                    continue
+                failures = 0
+                offset += len(chunk)
+                now = time.monotonic()
+                if on_progress and (last or now - last_report >= self.progress_interval):
+                    last_report = now
+                    on_progress(offset, total)
+                if last:
+                    return response.json().get("file", {})
+        finally:
+            if f:
+                f.close()
+
+    def _retry_wait(self, failures, error, cancel_token) -> int:
+        """Count a failure, give up past max_retries, else back off; returns the new count."""
+        failures += 1
+        if failures > self.max_retries:
+            raise ResumableUploadError(f"Upload failed after {self.max_retries} retries: {error}") from error
+        end = time.monotonic() + min(self.max_backoff, self.backoff * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+        while True:
+            if cancel_token is not None:
+                cancel_token.check()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return failures
+            time.sleep(min(remaining, 0.1))
+
+    def _start(self, total, mime_type, display_name, cancel_token=None) -> str:
+        """Open an upload session, retrying like a chunk; returns its upload URL."""
+        failures = 0
+        while True:
+            if cancel_token is not None:
+                cancel_token.check()
+            try:
+                response = self.session.post(
+                    UPLOAD_URL,
+                    timeout=self.timeout,
+                    headers={
+                        "x-goog-api-key": self.api_key,
+                        "X-Goog-Upload-Protocol": "resumable",
+                        "X-Goog-Upload-Command": "start",
+                        "X-Goog-Upload-Header-Content-Length": str(total),
+                        "X-Goog-Upload-Header-Content-Type": mime_type,
+                        "Content-Type": "application/json",
+                    },
+                    json={"file": {"display_name": display_name}} if display_name else {},
+                )
+                response.raise_for_status()
+                break
+            except requests.RequestException as e:
+                if not _retryable(e):
+                    raise ResumableUploadError(f"Could not start upload: {e}") from e
+                failures = self._retry_wait(failures, e, cancel_token)
+        upload_url = response.headers.get("X-Goog-Upload-URL")
+        if not upload_url:
+            raise ResumableUploadError("Upload session was not created")
+        return upload_url
+
+    def _query(self, upload_url):
+        """
+        Ask the server how much it has; returns (offset, file resource if
+        already finished). Raises requests exceptions when it can't be asked.
+        """
+        response = self.session.post(upload_url, timeout=self.timeout,
+                                     headers={"X-Goog-Upload-Command": "query", "Content-Length": "0"})
+        if response.status_code in RETRY_STATUS:
+            raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+        response.raise_for_status()
+        if response.headers.get("X-Goog-Upload-Status") == "final":
+            try:
+                return 0, response.json().get("file", {})
+            except ValueError:
+                raise ResumableUploadError("Upload finished but the file was not returned")
+        return int(response.headers.get("X-Goog-Upload-Size-Received", 0)), None
@@ -0,0 +1,107 @@
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from modules import storage
+
+TRUE_VALUES = {"true", "1", "yes"}
+
+
+class SettingsStore:
+    """
+    In-memory copy of the `key` settings table.
+
+    The table is read once with a single query; after that every lookup is a
+    dict access. Writes go to disk first and then update the cache, and any
+    typed value derived from the changed key (bool, parsed JSON) is dropped.
+    """
+
+    def __init__(self):
+        self._values: Optional[Dict[str, str]] = None
+        self._parsed: Dict[tuple, Any] = {}
+        self._lock = threading.RLock()
+
+    def load(self):
+        """(Re)load every setting from disk."""
+        with self._lock:
+            self._values = storage.get_all_records()
+            self._parsed.clear()
+
+    def _ensure_loaded(self):
+        if self._values is None:
+            self.load()
+
+    def get(self, key, default=None) -> Optional[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._values.get(key, default)
+
+    def get_bool(self, key, default: bool = False) -> bool:
+        """Return a setting stored as 'true'/'1'/'yes' as a real bool."""
+        with self._lock:
+            self._ensure_loaded()
+            cache_key = (key, "bool")
+            if cache_key not in self._parsed:
+                raw = self._values.get(key)
+                self._parsed[cache_key] = default if raw is None else str(raw).lower() in TRUE_VALUES
+            return self._parsed[cache_key]
+
+    def get_json(self, key, default=None):
+        """
+        Return a JSON setting (e.g. HA_DATA) parsed once and cached.
+
+        Raises ValueError if the stored value is not valid JSON. The returned
+        object is shared, treat it as read-only.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            cache_key = (key, "json")
+            if cache_key not in self._parsed:
+                raw = self._values.get(key)
+                if not raw:
+                    return default
+                self._parsed[cache_key] = json.loads(raw)
+            return self._parsed[cache_key]
+
+    def set(self, key, value):
+        """Write a setting to disk and refresh the cached copy."""
+        with self._lock:
+            self._ensure_loaded()
+            storage.add_record(key, value)
+            self._values[key] = value
+            self._invalidate(key)
+
+    def delete(self, key) -> int:
+        """Remove a setting from disk and cache; returns rows removed."""
+        with self._lock:
+            self._ensure_loaded()
+            removed = storage.remove_record(key)
+            self._values.pop(key, None)
+            self._invalidate(key)
+            return removed
+
+    def set_many(self, values: Dict[str, str]):
+        """Write several settings in one transaction."""
+        self.apply(updates=values)
+
+    def delete_many(self, keys) -> int:
+        """Remove several settings in one transaction; returns rows removed."""
+        return self.apply(deletes=keys)
+
+    def apply(self, updates: Optional[Dict[str, str]] = None, deletes=()) -> int:
+        """Upsert `updates` and remove `deletes` atomically, then refresh the cache."""
+        deletes = list(deletes)
+        with self._lock:
+            self._ensure_loaded()
+            removed = storage.apply_records(updates, deletes)
+            for key in deletes:
+                self._values.pop(key, None)
+                self._invalidate(key)
+            for key, value in (updates or {}).items():
+                self._values[key] = value
+                self._invalidate(key)
+            return removed
+
+    def _invalidate(self, key):
+        for cache_key in [k for k in self._parsed if k[0] == key]:
+            del self._parsed[cache_key]
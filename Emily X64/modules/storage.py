@@ -0,0 +1,800 @@
+import re
+import sqlite3
+import threading
+import weakref
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+INTERACTION_DB = "interaction"
+KEY_DB = "key"
+
+# Tuned for a single desktop user: WAL lets the UI read history while a turn
+# is being written, NORMAL sync is durable across app crashes in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA temp_store=MEMORY",
+)
+STATEMENT_CACHE_SIZE = 128
+
+# interactions.format values. Messages at least COMPRESSION_THRESHOLD bytes
+# long are stored zlib-compressed when that saves 10% or more; set the
+# threshold to None to store everything as plain text.
+FORMAT_TEXT = 0
+FORMAT_ZLIB = 1
+COMPRESSION_THRESHOLD: Optional[int] = 2048
+COMPRESSION_LEVEL = 6
+
+_db_paths: Dict[str, str] = {}
+_local = threading.local()
+_thread_pools = weakref.WeakSet()
+_connections_lock = threading.Lock()
+
+
+def configure(interaction_db_path, key_db_path):
+    """Register the database files used by every helper in this module."""
+    _db_paths[INTERACTION_DB] = str(interaction_db_path)
+    _db_paths[KEY_DB] = str(key_db_path)
+
+
+def _open(name: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        _db_paths[name],
+        timeout=10,
+        isolation_level=None,  # autocommit; multi-statement work goes through transaction()
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    # Used by the FTS triggers to index the text of compressed rows
+    conn.create_function("inflate_parts", 2, decode_parts, deterministic=True)
+    return conn
+
+
+def encode_parts(text: str, threshold: Optional[int] = -1):
+    """Return (stored value, format) for a message about to be written."""
+    if threshold == -1:
+        threshold = COMPRESSION_THRESHOLD
+    if threshold is not None and isinstance(text, str):
+        data = text.encode("utf-8")
+        if len(data) >= threshold:
+            packed = zlib.compress(data, COMPRESSION_LEVEL)
+            if len(packed) <= len(data) * 0.9:
+                return packed, FORMAT_ZLIB
+    return text, FORMAT_TEXT
+
+
+def decode_parts(value, fmt) -> str:
+    """Inverse of encode_parts()."""
+    if fmt == FORMAT_ZLIB:
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+
+def _close_all(connections: Dict[str, sqlite3.Connection]):
+    for name in list(connections):
+        conn = connections.pop(name, None)
+        if conn is None:
+            continue
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+class _ThreadConnections:
+    """
+    The connections opened by one thread. It lives in the thread-local, so
+    it is dropped when the thread ends and the finalizer closes them; the
+    JS bridge runs every call on a new short-lived thread.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, sqlite3.Connection] = {}
+        weakref.finalize(self, _close_all, self.connections)
+        with _connections_lock:
+            _thread_pools.add(self)
+
+
+def get_connection(name: str) -> sqlite3.Connection:
+    """Return the connection to `name` owned by the calling thread, open until the thread ends."""
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = _ThreadConnections()
+    conn = pool.connections.get(name)
+    if conn is None:
+        conn = pool.connections[name] = _open(name)
+    return conn
+
+
+@contextmanager
+def transaction(name: str):
+    """Run a block of statements on `name` as one atomic write transaction."""
+    conn = get_connection(name)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+# ---------------------------------------------------------------------------
+# Schema migrations
+# ---------------------------------------------------------------------------
+
+# Each database carries its schema version in PRAGMA user_version. Entry N of
+# a list upgrades version N to N+1, either as SQL statements or as a callable
+# taking the connection. Append new steps; never edit or reorder shipped ones.
+Migration = Union[Sequence[str], Callable[[sqlite3.Connection], None]]
+
+def _create_interactions_fts(conn: sqlite3.Connection):
+    """
+    Full-text index over interactions.parts, rowid = interactions.ID.
+
+    The FTS table keeps its own copy of the text (no external content) so
+    snippets never depend on how `parts` is stored. Triggers keep it in sync
+    and existing rows are backfilled once. Builds of SQLite without FTS5
+    skip this step and search_interactions() falls back to LIKE.
+    """
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts "
+            "USING fts5(parts, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except sqlite3.OperationalError:
+        return
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS interactions_fts_insert AFTER INSERT ON interactions BEGIN
+        INSERT INTO interactions_fts (rowid, parts) VALUES (new.ID, new.parts);
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS interactions_fts_delete AFTER DELETE ON interactions BEGIN
+        DELETE FROM interactions_fts WHERE rowid = old.ID;
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS interactions_fts_update AFTER UPDATE OF parts ON interactions BEGIN
+        UPDATE interactions_fts SET parts = new.parts WHERE rowid = old.ID;
+    END""")
+    conn.execute("DELETE FROM interactions_fts")
+    conn.execute("INSERT INTO interactions_fts (rowid, parts) SELECT ID, parts FROM interactions")
+    conn.execute("INSERT INTO interactions_fts (interactions_fts) VALUES ('optimize')")
+
+
+def _add_parts_format(conn: sqlite3.Connection):
+    """Add the per-row storage format flag and make the FTS triggers index decoded text."""
+    conn.execute(f"ALTER TABLE interactions ADD COLUMN format INTEGER NOT NULL DEFAULT {FORMAT_TEXT}")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'interactions_fts'").fetchone() is None:
+        return
+    conn.execute("DROP TRIGGER IF EXISTS interactions_fts_insert")
+    conn.execute("DROP TRIGGER IF EXISTS interactions_fts_update")
+    conn.execute("""CREATE TRIGGER interactions_fts_insert AFTER INSERT ON interactions BEGIN
+        INSERT INTO interactions_fts (rowid, parts) VALUES (new.ID, inflate_parts(new.parts, new.format));
+    END""")
+    # Re-encoding a row (see recompress_interactions) leaves its text, and so the index, unchanged
+    conn.execute("""CREATE TRIGGER interactions_fts_update AFTER UPDATE OF parts ON interactions
+    WHEN inflate_parts(new.parts, new.format) IS NOT inflate_parts(old.parts, old.format) BEGIN
+        UPDATE interactions_fts SET parts = inflate_parts(new.parts, new.format) WHERE rowid = old.ID;
+    END""")
+
+
+def _external_content_fts(conn: sqlite3.Connection):
+    """
+    Rebuild the full-text index without its own copy of the text.
+
+    The index reads content through the interactions_text view, which
+    decodes `parts`, so compressed rows are no longer stored a second time
+    uncompressed. With external content the old text must be supplied to
+    remove a row from the index, hence the 'delete' commands in the triggers.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'interactions_fts'").fetchone() is None:
+        return
+    for trigger in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS interactions_fts_{trigger}")
+    conn.execute("DROP TABLE interactions_fts")
+    conn.execute("CREATE VIEW interactions_text AS SELECT ID, inflate_parts(parts, format) AS parts FROM interactions")
+    conn.execute(
+        "CREATE VIRTUAL TABLE interactions_fts USING fts5(parts, content='interactions_text', content_rowid='ID', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.execute("""CREATE TRIGGER interactions_fts_insert AFTER INSERT ON interactions BEGIN
+        INSERT INTO interactions_fts (rowid, parts) VALUES (new.ID, inflate_parts(new.parts, new.format));
+    END""")
+    conn.execute("""CREATE TRIGGER interactions_fts_delete AFTER DELETE ON interactions BEGIN
+        INSERT INTO interactions_fts (interactions_fts, rowid, parts) VALUES ('delete', old.ID, inflate_parts(old.parts, old.format));
+    END""")
+    conn.execute("""CREATE TRIGGER interactions_fts_update AFTER UPDATE OF parts ON interactions
+    WHEN inflate_parts(new.parts, new.format) IS NOT inflate_parts(old.parts, old.format) BEGIN
+        INSERT INTO interactions_fts (interactions_fts, rowid, parts) VALUES ('delete', old.ID, inflate_parts(old.parts, old.format));
+        INSERT INTO interactions_fts (rowid, parts) VALUES (new.ID, inflate_parts(new.parts, new.format));
+    END""")
+    conn.execute("INSERT INTO interactions_fts (interactions_fts) VALUES ('rebuild')")
+
+
+def _index_archived_interactions(conn: sqlite3.Connection):
+    """
+    Keep archived turns searchable.
+
+    interactions_text now covers the archive as well, and moving a row to
+    the archive (archive_interactions inserts the copy before deleting the
+    original) no longer removes it from the index. Deleting it from the
+    archive does. The rebuild restores rows that earlier archiving removed.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'interactions_fts'").fetchone() is None:
+        return
+    conn.execute("DROP VIEW interactions_text")
+    conn.execute("""CREATE VIEW interactions_text AS
+        SELECT ID, inflate_parts(parts, format) AS parts FROM interactions
+        UNION ALL
+        SELECT ID, inflate_parts(parts, format) AS parts FROM interactions_archive""")
+    conn.execute("DROP TRIGGER interactions_fts_delete")
+    conn.execute("""CREATE TRIGGER interactions_fts_delete AFTER DELETE ON interactions
+    WHEN NOT EXISTS (SELECT 1 FROM interactions_archive WHERE ID = old.ID) BEGIN
+        INSERT INTO interactions_fts (interactions_fts, rowid, parts) VALUES ('delete', old.ID, inflate_parts(old.parts, old.format));
+    END""")
+    conn.execute("""CREATE TRIGGER interactions_archive_fts_delete AFTER DELETE ON interactions_archive
+    WHEN NOT EXISTS (SELECT 1 FROM interactions WHERE ID = old.ID) BEGIN
+        INSERT INTO interactions_fts (interactions_fts, rowid, parts) VALUES ('delete', old.ID, inflate_parts(old.parts, old.format));
+    END""")
+    conn.execute("INSERT INTO interactions_fts (interactions_fts) VALUES ('rebuild')")
+
+
+INTERACTION_MIGRATIONS: List[Migration] = [
+    # 1: base table (databases created before versioning already have it)
+    (
+        """CREATE TABLE IF NOT EXISTS interactions (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            parts TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        )""",
+    ),
+    # 2: ID is the rowid so ID-ordered reads are already index-backed; the
+    # timestamp index serves date-range queries
+    (
+        "CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions(timestamp)",
+        "ANALYZE interactions",
+    ),
+    # 3: full-text search
+    _create_interactions_fts,
+    # 4: optional per-row compression
+    _add_parts_format,
+    # 5: cold storage for turns moved out by archive_interactions(); rows keep
+    # their original ID so history pages continue seamlessly into the archive
+    (
+        f"""CREATE TABLE IF NOT EXISTS interactions_archive (
+            ID INTEGER PRIMARY KEY,
+            role TEXT NOT NULL,
+            parts TEXT NOT NULL,
+            format INTEGER NOT NULL DEFAULT {FORMAT_TEXT},
+            timestamp TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )""",
+    ),
+    # 6: rolling conversation summaries; each row covers interactions
+    # first_id..last_id, higher levels summarize several lower-level rows
+    (
+        """CREATE TABLE IF NOT EXISTS summaries (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            level INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_summaries_level ON summaries(level, first_id)",
+    ),
+    # 7: content-addressed cache of uploaded attachments and file analyses
+    (
+        """CREATE TABLE IF NOT EXISTS attachment_cache (
+            key TEXT PRIMARY KEY,
+            remote_name TEXT,
+            uri TEXT,
+            mime_type TEXT,
+            expires_at REAL,
+            analysis TEXT,
+            bytes INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_attachment_cache_last_used ON attachment_cache(last_used)",
+    ),
+    # 8: full-text index without a second, uncompressed copy of every message
+    _external_content_fts,
+    # 9: archived turns stay in the full-text index
+    _index_archived_interactions,
+]
+
+KEY_MIGRATIONS: List[Migration] = [
+    # 1: base table; the UNIQUE constraint doubles as the lookup index
+    (
+        """CREATE TABLE IF NOT EXISTS key (
+            type TEXT NOT NULL UNIQUE,
+            value TEXT NOT NULL
+        )""",
+    ),
+]
+
+MIGRATIONS: Dict[str, List[Migration]] = {
+    INTERACTION_DB: INTERACTION_MIGRATIONS,
+    KEY_DB: KEY_MIGRATIONS,
+}
+
+
+def schema_version(name: str) -> int:
+    return get_connection(name).execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(name: str) -> int:
+    """Apply every pending migration to `name`, each in its own transaction; returns the new version."""
+    migrations = MIGRATIONS[name]
+    while True:
+        with transaction(name) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(migrations):
+                return version
+            step = migrations[version]
+            if callable(step):
+                step(conn)
+            else:
+                for statement in step:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+
+
+def close_connections():
+    """Close every pooled connection (all threads); they reopen lazily on next use."""
+    with _connections_lock:
+        pools = list(_thread_pools)
+    for pool in pools:
+        _close_all(pool.connections)
+
+
+# ---------------------------------------------------------------------------
+# key_data.dll
+# ---------------------------------------------------------------------------
+
+def remove_record(id) -> int:
+    """Delete a setting; returns the number of rows removed."""
+    cursor = get_connection(KEY_DB).execute("DELETE FROM key WHERE type = ?", (id,))
+    return cursor.rowcount
+
+
+UPSERT_RECORD = "INSERT INTO key (type, value) VALUES (?, ?) ON CONFLICT(type) DO UPDATE SET value = excluded.value"
+
+
+def add_record(id, value):
+    """Insert or update a setting."""
+    get_connection(KEY_DB).execute(UPSERT_RECORD, (id, value))
+
+
+def apply_records(updates: Optional[Dict[str, str]] = None, deletes: Iterable[str] = ()) -> int:
+    """
+    Apply a whole settings change atomically: upsert `updates`, remove `deletes`.
+
+    Everything happens in one transaction, so a crash can never leave e.g. a
+    new session token paired with an old refresh token. Returns rows deleted.
+    """
+    with transaction(KEY_DB) as conn:
+        removed = 0
+        if deletes:
+            removed = conn.executemany("DELETE FROM key WHERE type = ?", [(key,) for key in deletes]).rowcount
+        if updates:
+            conn.executemany(UPSERT_RECORD, list(updates.items()))
+        return removed
+
+
+def get_all_records() -> Dict[str, str]:
+    """Return the whole settings table as a dict in a single query."""
+    return dict(get_connection(KEY_DB).execute("SELECT type, value FROM key").fetchall())
+
+
+def get_value_by_id(id) -> Optional[str]:
+    """Return the stored value of a setting, or None."""
+    row = get_connection(KEY_DB).execute("SELECT value FROM key WHERE type = ?", (id,)).fetchone()
+    return row[0] if row else None
+
+
+# ---------------------------------------------------------------------------
+# interaction_data.dll
+# ---------------------------------------------------------------------------
+
+def insert_into_db(role, parts, timestamp=None):
+    """Store one chat message."""
+    value, fmt = encode_parts(parts)
+    get_connection(INTERACTION_DB).execute(
+        "INSERT INTO interactions (role, parts, format, timestamp) VALUES (?, ?, ?, ?)",
+        (role, value, fmt, timestamp or datetime.now().isoformat()),
+    )
+
+
+def insert_interactions(rows: Iterable[Sequence], clear_existing: bool = False) -> int:
+    """
+    Store many messages in one transaction.
+
+    `rows` yields (role, parts) or (role, parts, timestamp) tuples in
+    chronological order; a missing timestamp means "now". With
+    `clear_existing` the history (archive and summaries too) is emptied in the same transaction, so a
+    failed restore leaves the old history intact. Returns rows written.
+    """
+    def _normalise():
+        for row in rows:
+            role, parts = row[0], row[1]
+            timestamp = row[2] if len(row) > 2 else None
+            value, fmt = encode_parts(parts)
+            yield role, value, fmt, timestamp or datetime.now().isoformat()
+
+    with transaction(INTERACTION_DB) as conn:
+        if clear_existing:
+            conn.execute("DELETE FROM interactions")
+            conn.execute("DELETE FROM interactions_archive")
+            conn.execute("DELETE FROM summaries")
+        cursor = conn.executemany(
+            "INSERT INTO interactions (role, parts, format, timestamp) VALUES (?, ?, ?, ?)",
+            _normalise(),
+        )
+        return cursor.rowcount
+
+
+def get_interactions(history_cont, timestamp=False):
+    """Return the newest `history_cont` messages, formatted for Gemini."""
+    conn = get_connection(INTERACTION_DB)
+    if timestamp:
+        rows = conn.execute(
+            "SELECT role, parts, format, timestamp FROM interactions ORDER BY ID DESC LIMIT ?",
+            (int(history_cont),),
+        ).fetchall()
+        return [
+            {"role": role, "parts": [{"text": decode_parts(parts, fmt)}], "timestamp": timestamp_val}
+            for role, parts, fmt, timestamp_val in rows
+        ]
+    rows = conn.execute(
+        "SELECT role, parts, format FROM interactions ORDER BY ID DESC LIMIT ?",
+        (int(history_cont),),
+    ).fetchall()
+    return [{"role": role, "parts": [{"text": decode_parts(parts, fmt)}]} for role, parts, fmt in rows]
+
+
+def get_recent_interactions(limit: int):
+    """Return the newest `limit` messages as (id, role, text) rows, newest first."""
+    rows = get_connection(INTERACTION_DB).execute(
+        "SELECT ID, role, parts, format FROM interactions ORDER BY ID DESC LIMIT ?", (int(limit),)
+    ).fetchall()
+    return [(row_id, role, decode_parts(parts, fmt)) for row_id, role, parts, fmt in rows]
+
+
+def get_interactions_page(before_id=None, limit=20):
+    """
+    Return up to `limit` messages older than `before_id` (newest first).
+
+    Keyset pagination on the ID primary key: each page is a range scan that
+    costs the same no matter how deep into the history it starts. Returns
+    (rows, has_more); pass the ID of the last row as the next `before_id`.
+    """
+    conn = get_connection(INTERACTION_DB)
+    rows = []
+    # Archived rows all have lower IDs than the live table, so a page that
+    # runs off the end of `interactions` simply continues in the archive
+    for table in ("interactions", "interactions_archive"):
+        if before_id is None:
+            rows += conn.execute(
+                f"SELECT ID, role, parts, format, timestamp FROM {table} ORDER BY ID DESC LIMIT ?",
+                (int(limit) + 1 - len(rows),),
+            ).fetchall()
+        else:
+            rows += conn.execute(
+                f"SELECT ID, role, parts, format, timestamp FROM {table} WHERE ID < ? ORDER BY ID DESC LIMIT ?",
+                (int(before_id), int(limit) + 1 - len(rows)),
+            ).fetchall()
+        if len(rows) > limit:
+            break
+        if rows:
+            before_id = rows[-1][0]
+    has_more = len(rows) > limit
+    return [
+        {"id": row_id, "role": role, "parts": [{"text": decode_parts(parts, fmt)}], "timestamp": timestamp_val}
+        for row_id, role, parts, fmt, timestamp_val in rows[:limit]
+    ], has_more
+
+
+def empty_database():
+    """Delete every stored chat message, archived ones, summaries and cached attachments included."""
+    with transaction(INTERACTION_DB) as conn:
+        conn.execute("DELETE FROM interactions")
+        conn.execute("DELETE FROM interactions_archive")
+        conn.execute("DELETE FROM summaries")
+        conn.execute("DELETE FROM attachment_cache")
+
+
+ARCHIVE_COMPRESSION_THRESHOLD = 256
+
+
+def archive_interactions(keep_rows: int, older_than: Optional[str] = None,
+                         min_keep_rows: int = 200, batch_size=1000) -> int:
+    """
+    Move cold turns from `interactions` into `interactions_archive`.
+
+    A row is cold when it is not among the newest `keep_rows` messages or,
+    if `older_than` (ISO timestamp) is given, was written before it. The
+    newest `min_keep_rows` always stay, however old, so a returning user
+    still has recent context. Archived rows are recompressed with a lower threshold. Works in small
+    transactions so chat writes are never blocked for long; returns the
+    number of rows moved.
+    """
+    conn = get_connection(INTERACTION_DB)
+
+    def _first_kept_id(count):
+        boundary = conn.execute(
+            "SELECT ID FROM interactions ORDER BY ID DESC LIMIT 1 OFFSET ?", (int(count),)
+        ).fetchone()
+        return boundary[0] + 1 if boundary else 0
+
+    keep_from = _first_kept_id(keep_rows)
+    always_keep_from = _first_kept_id(min_keep_rows)
+    moved = 0
+    while True:
+        rows = conn.execute(
+            """SELECT ID, role, parts, format, timestamp FROM interactions
+               WHERE (ID < ? OR timestamp < ?) AND ID < ? ORDER BY ID LIMIT ?""",
+            (keep_from, older_than or "", always_keep_from, batch_size),
+        ).fetchall()
+        if not rows:
+            return moved
+        archived_at = datetime.now().isoformat()
+        archive_rows = []
+        for row_id, role, parts, fmt, timestamp_val in rows:
+            value, new_fmt = encode_parts(decode_parts(parts, fmt), ARCHIVE_COMPRESSION_THRESHOLD)
+            archive_rows.append((row_id, role, value, new_fmt, timestamp_val, archived_at))
+        with transaction(INTERACTION_DB) as write_conn:
+            write_conn.executemany(
+                "INSERT OR REPLACE INTO interactions_archive (ID, role, parts, format, timestamp, archived_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                archive_rows,
+            )
+            write_conn.executemany("DELETE FROM interactions WHERE ID = ?", [(row[0],) for row in rows])
+        moved += len(rows)
+
+
+def run_maintenance(vacuum_free_ratio: float = 0.2) -> Dict[str, object]:
+    """
+    Housekeeping for an idle app: refresh planner statistics, merge FTS
+    segments, checkpoint the WAL and VACUUM when enough pages are free.
+    """
+    report: Dict[str, object] = {}
+    for name in (INTERACTION_DB, KEY_DB):
+        conn = get_connection(name)
+        conn.execute("PRAGMA optimize")
+        if name == INTERACTION_DB and has_fts():
+            conn.execute("INSERT INTO interactions_fts (interactions_fts) VALUES ('optimize')")
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        vacuumed = bool(page_count) and free_pages / page_count >= vacuum_free_ratio
+        if vacuumed:
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        report[name] = {"pages": page_count, "free_pages": free_pages, "vacuumed": vacuumed}
+    return report
+
+
+def _used_bytes(conn: sqlite3.Connection) -> int:
+    """Bytes of the database held by live pages (free pages excluded)."""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - free_pages) * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def recompress_interactions(batch_size=500) -> Dict[str, int]:
+    """
+    Re-encode every stored message with the current compression settings.
+
+    Works in ID-ordered batches, one transaction each, so the UI is never
+    locked out for long. Returns how many rows changed, the stored payload
+    size before and after, and the bytes of database pages in use before
+    and after (`db_bytes_*`). The page figures are what the file actually
+    shrinks by once maintenance VACUUMs the freed pages.
+    """
+    conn = get_connection(INTERACTION_DB)
+    stats = {"rows_changed": 0, "bytes_before": 0, "bytes_after": 0, "db_bytes_before": _used_bytes(conn)}
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT ID, parts, format FROM interactions WHERE ID > ? ORDER BY ID LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            stats["db_bytes_after"] = _used_bytes(conn)
+            return stats
+        updates = []
+        for row_id, parts, fmt in rows:
+            new_value, new_fmt = encode_parts(decode_parts(parts, fmt))
+            stats["bytes_before"] += len(parts if isinstance(parts, bytes) else parts.encode("utf-8"))
+            stats["bytes_after"] += len(new_value if isinstance(new_value, bytes) else new_value.encode("utf-8"))
+            if new_fmt != fmt or new_value != parts:
+                updates.append((new_value, new_fmt, row_id))
+        if updates:
+            with transaction(INTERACTION_DB) as write_conn:
+                write_conn.executemany("UPDATE interactions SET parts = ?, format = ? WHERE ID = ?", updates)
+            stats["rows_changed"] += len(updates)
+        last_id = rows[-1][0]
+
+
+SEARCH_RANK_WINDOW = 5000
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def has_fts() -> bool:
+    conn = get_connection(INTERACTION_DB)
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'interactions_fts'"
+    ).fetchone() is not None
+
+
+def search_interactions(query: str, limit=20, offset=0):
+    """
+    Full-text search over stored messages, best match first.
+
+    Returns (results, has_more); each result has id, role, timestamp and a
+    short snippet with matches wrapped in ** for markdown rendering.
+    Archived messages are searched too.
+    """
+    conn = get_connection(INTERACTION_DB)
+    limit, offset = int(limit), int(offset)
+    if has_fts():
+        match = _fts_query(query)
+        if not match:
+            return [], False
+        # Ranking touches every matching row, so very common words are ranked
+        # among their most recent SEARCH_RANK_WINDOW matches only. Finding that
+        # boundary walks the doclist by rowid and needs no scoring.
+        boundary = conn.execute(
+            "SELECT rowid FROM interactions_fts WHERE interactions_fts MATCH ? "
+            "ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (match, SEARCH_RANK_WINDOW - 1),
+        ).fetchone()
+        rows = conn.execute(
+            # A row is either live or archived; two lookups by primary key keep
+            # `hits` evaluated once and in rank order
+            """SELECT hits.rowid, COALESCE(live.role, archived.role),
+                      COALESCE(live.timestamp, archived.timestamp), hits.snippet
+               FROM (SELECT rowid, rank, snippet(interactions_fts, 0, '**', '**', '...', 24) AS snippet
+                     FROM interactions_fts
+                     WHERE interactions_fts MATCH ? AND rowid >= ?
+                     ORDER BY rank
+                     LIMIT ? OFFSET ?) AS hits
+               LEFT JOIN interactions AS live ON live.ID = hits.rowid
+               LEFT JOIN interactions_archive AS archived ON archived.ID = hits.rowid
+               WHERE live.ID IS NOT NULL OR archived.ID IS NOT NULL
+               ORDER BY hits.rank""",
+            (match, boundary[0] if boundary else 0, limit + 1, offset),
+        ).fetchall()
+    else:
+        if not query.strip():
+            return [], False
+        rows = conn.execute(
+            """SELECT ID, role, timestamp, substr(inflate_parts(parts, format), 1, 200)
+               FROM (SELECT ID, role, timestamp, parts, format FROM interactions
+                     UNION ALL
+                     SELECT ID, role, timestamp, parts, format FROM interactions_archive)
+               WHERE inflate_parts(parts, format) LIKE ? ESCAPE '\\'
+               ORDER BY ID DESC LIMIT ? OFFSET ?""",
+            ("%" + re.sub(r"([%_\\])", r"\\\1", query.strip()) + "%", limit + 1, offset),
+        ).fetchall()
+    has_more = len(rows) > limit
+    return [
+        {"id": row_id, "role": role, "timestamp": timestamp_val, "snippet": snippet}
+        for row_id, role, timestamp_val, snippet in rows[:limit]
+    ], has_more
+
+
+def nth_newest_interaction_id(offset: int) -> Optional[int]:
+    """ID of the message `offset` rows below the newest one (0 = newest), or None."""
+    row = get_connection(INTERACTION_DB).execute(
+        "SELECT ID FROM interactions ORDER BY ID DESC LIMIT 1 OFFSET ?", (int(offset),)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def count_interactions_after(after_id: int) -> int:
+    """Number of messages with an ID above `after_id`."""
+    row = get_connection(INTERACTION_DB).execute(
+        "SELECT COUNT(*) FROM interactions WHERE ID > ?", (after_id,)
+    ).fetchone()
+    return row[0]
+
+
+def get_interactions_between(after_id: int, up_to_id: int, limit: int):
+    """Return up to `limit` (id, role, text) rows with after_id < ID <= up_to_id, oldest first."""
+    rows = get_connection(INTERACTION_DB).execute(
+        "SELECT ID, role, parts, format FROM interactions WHERE ID > ? AND ID <= ? ORDER BY ID LIMIT ?",
+        (after_id, up_to_id, int(limit)),
+    ).fetchall()
+    return [(row_id, role, decode_parts(parts, fmt)) for row_id, role, parts, fmt in rows]
+
+
+def get_summaries(level: Optional[int] = None):
+    """Return stored summaries in conversation order, optionally for one level."""
+    conn = get_connection(INTERACTION_DB)
+    if level is None:
+        rows = conn.execute("SELECT ID, level, first_id, last_id, text FROM summaries ORDER BY first_id, level DESC").fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT ID, level, first_id, last_id, text FROM summaries WHERE level = ? ORDER BY first_id", (level,)
+        ).fetchall()
+    return [
+        {"id": row_id, "level": lvl, "first_id": first_id, "last_id": last_id, "text": text}
+        for row_id, lvl, first_id, last_id, text in rows
+    ]
+
+
+def summary_coverage() -> int:
+    """Highest interaction ID covered by a summary (0 if there are none)."""
+    row = get_connection(INTERACTION_DB).execute("SELECT MAX(last_id) FROM summaries").fetchone()
+    return row[0] or 0
+
+
+def add_summary(level: int, first_id: int, last_id: int, text: str, replaces: Iterable[int] = ()) -> int:
+    """Store a summary and delete the rows it `replaces` in the same transaction; returns its ID."""
+    with transaction(INTERACTION_DB) as conn:
+        cursor = conn.execute(
+            "INSERT INTO summaries (level, first_id, last_id, text, created_at) VALUES (?, ?, ?, ?, ?)",
+            (level, first_id, last_id, text, datetime.now().isoformat()),
+        )
+        conn.executemany("DELETE FROM summaries WHERE ID = ?", [(row_id,) for row_id in replaces])
+        return cursor.lastrowid
+
+
+ATTACHMENT_CACHE_COLUMNS = ("key", "remote_name", "uri", "mime_type", "expires_at", "analysis", "bytes", "last_used")
+
+
+def get_attachment_cache(key: str, now: float) -> Optional[Dict[str, object]]:
+    """Return the cache row for `key` (marking it used at `now`), or None."""
+    with transaction(INTERACTION_DB) as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(ATTACHMENT_CACHE_COLUMNS)} FROM attachment_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE attachment_cache SET last_used = ? WHERE key = ?", (now, key))
+    return dict(zip(ATTACHMENT_CACHE_COLUMNS, row))
+
+
+def put_attachment_cache(key: str, now: float, remote_name=None, uri=None, mime_type=None,
+                         expires_at=None, analysis=None):
+    """Insert or replace a cache row; its size counts towards the cache cap."""
+    size = sum(len(value) for value in (key, remote_name, uri, mime_type, analysis) if value)
+    with transaction(INTERACTION_DB) as conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO attachment_cache ({', '.join(ATTACHMENT_CACHE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, remote_name, uri, mime_type, expires_at, analysis, size, now),
+        )
+
+
+def evict_attachment_cache(max_bytes: int, max_entries: int, now: float) -> int:
+    """
+    Drop expired uploads, then least recently used rows beyond the caps.
+
+    Returns rows removed.
+    """
+    with transaction(INTERACTION_DB) as conn:
+        removed = conn.execute(
+            "DELETE FROM attachment_cache WHERE analysis IS NULL AND expires_at IS NOT NULL AND expires_at < ?", (now,)
+        ).rowcount
+        total = 0
+        stale = []
+        for index, (key, size) in enumerate(conn.execute("SELECT key, bytes FROM attachment_cache ORDER BY last_used DESC")):
+            total += size
+            if total > max_bytes or index >= max_entries:
+                stale.append((key,))
+        conn.executemany("DELETE FROM attachment_cache WHERE key = ?", stale)
+        return removed + len(stale)
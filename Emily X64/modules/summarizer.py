@@ -0,0 +1,147 @@
+import threading
+from typing import Optional
+
+from modules import storage
+
+
+class ConversationSummarizer:
+    """
+    Keeps compact, hierarchical summaries of older chat history in SQLite.
+
+    After each turn call schedule(); a background thread then summarizes
+    every full chunk of `chunk_rows` messages older than the ones the chat
+    session holds verbatim. A session builder reports the oldest row it
+    kept with cover_until(), which also summarizes everything up to that
+    row (a short last chunk included) so summaries and verbatim turns
+    meet without a gap. Until then the newest `keep_recent_rows` are
+    assumed to be the verbatim ones. Once a level
+    holds more than `fanout` summaries the oldest `fanout` are merged into
+    one summary a level up; at `max_level` they are merged in place. The
+    stored set therefore stays a handful of rows however long the history
+    gets, and context_text() returns them in conversation order.
+
+    On a database that predates summaries only the newest `backfill_rows`
+    messages are summarized, so upgrading does not burn through the quota.
+
+    :param summarize: callable(text, kind) -> str, where kind is "turns"
+        (a transcript) or "summaries" (earlier summaries to merge).
+    :param before_run: optional callable run first (e.g. flushing queued writes).
+    """
+
+    def __init__(self, summarize, chunk_rows: int = 40, keep_recent_rows: int = 40,
+                 backfill_rows: int = 400, fanout: int = 4, max_level: int = 2, before_run=None):
+        self.summarize = summarize
+        self.chunk_rows = chunk_rows
+        self.keep_recent_rows = keep_recent_rows
+        self.backfill_rows = backfill_rows
+        self.fanout = fanout
+        self.max_level = max_level
+        self.before_run = before_run
+        self.last_error = None
+        self._verbatim_from = None
+        self._wake = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self):
+        """Summarize whatever became old enough, on the background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="summarizer", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                # Summaries are an optimisation; try again after the next turn
+                self.last_error = e
+
+    def cover_until(self, first_verbatim_id: Optional[int]) -> int:
+        """
+        Record that the chat session holds messages from `first_verbatim_id`
+        on verbatim (None: no history) and summarize everything before it
+        now; returns summaries written.
+        """
+        self._verbatim_from = first_verbatim_id
+        return self.run_once()
+
+    def run_once(self) -> int:
+        """Summarize all pending chunks and roll levels up; returns summaries written."""
+        with self._run_lock:
+            if self.before_run:
+                self.before_run()
+            written = 0
+            while True:
+                if self._verbatim_from is not None:
+                    boundary = self._verbatim_from - 1
+                    recent_rows = storage.count_interactions_after(boundary)
+                else:
+                    boundary = storage.nth_newest_interaction_id(self.keep_recent_rows)
+                    recent_rows = self.keep_recent_rows
+                if boundary is None:
+                    break
+                start_after = storage.summary_coverage()
+                oldest_wanted = storage.nth_newest_interaction_id(recent_rows + self.backfill_rows)
+                if oldest_wanted is not None:
+                    start_after = max(start_after, oldest_wanted - 1)
+                rows = storage.get_interactions_between(start_after, boundary, self.chunk_rows)
+                full = len(rows) == self.chunk_rows
+                if not rows or (not full and self._verbatim_from is None):
+                    break
+                # Each turn is stored model-then-user; don't split one across chunks
+                if full and rows[-1][1] == "model" and len(rows) > 1:
+                    rows = rows[:-1]
+                text = self.summarize(format_transcript(rows), "turns")
+                if not text:
+                    break
+                storage.add_summary(0, rows[0][0], rows[-1][0], text)
+                written += 1 + self._roll_up()
+            return written
+
+    def _roll_up(self) -> int:
+        written = 0
+        for level in range(self.max_level + 1):
+            summaries = storage.get_summaries(level)
+            while len(summaries) > self.fanout:
+                merged, summaries = summaries[:self.fanout], summaries[self.fanout:]
+                text = self.summarize("\n\n".join(s["text"] for s in merged), "summaries")
+                target = min(level + 1, self.max_level)
+                storage.add_summary(target, merged[0]["first_id"], merged[-1]["last_id"], text,
+                                    replaces=[s["id"] for s in merged])
+                written += 1
+                if target == level:
+                    summaries = storage.get_summaries(level)
+        return written
+
+    def context_text(self) -> str:
+        """All stored summaries, oldest first, ready to seed a new chat session."""
+        return "\n\n".join(s["text"] for s in storage.get_summaries())
+
+
+def asking_order(rows):
+    """
+    Yield (id, role, text) rows, given oldest first, in the order they were said.
+
+    Turns are stored as the model reply followed by the user message that
+    prompted it; each such pair is swapped back into asking order.
+    """
+    i = 0
+    while i < len(rows):
+        row_id, role, _ = rows[i]
+        if role == "model" and i + 1 < len(rows) and rows[i + 1][1] == "user" and rows[i + 1][0] == row_id + 1:
+            yield rows[i + 1]
+            yield rows[i]
+            i += 2
+            continue
+        yield rows[i]
+        i += 1
+
+
+def format_transcript(rows) -> str:
+    """Render (id, role, text) rows, oldest first, as a readable transcript."""
+    return "\n".join(f"{'Emily' if role == 'model' else 'User'}: {text}" for _, role, text in asking_order(rows))
@@ -0,0 +1,63 @@
+import codecs
+
+# Attachments with these extensions are read locally and sent as text
+TEXT_EXTENSIONS = {"py", "js", "txt", "md", "csv", "xml", "html", "css"}
+
+# Tried in order after BOM detection; cp1252 covers most legacy Windows files
+FALLBACK_ENCODINGS = ("utf-8", "cp1252")
+
+
+def decode_text(data: bytes) -> str:
+    """
+    Decode a text file and normalize it for the model.
+
+    Honours UTF-8/UTF-16 byte order marks, otherwise tries UTF-8 then
+    cp1252 (replacing anything undecodable). Line endings become '\\n' and
+    NUL characters are dropped.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        text = data[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace")
+    elif data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        text = data.decode("utf-16", errors="replace")
+    else:
+        for encoding in FALLBACK_ENCODINGS:
+            try:
+                text = data.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            text = data.decode("utf-8", errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+
+
+def chunk_text(text: str, max_chars: int):
+    """Split `text` into pieces of at most `max_chars`, breaking at line ends where possible."""
+    chunks = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = text.rfind("\n", start, start + max_chars)
+        if end <= start:
+            end = start + max_chars
+        else:
+            end += 1
+        chunks.append(text[start:end])
+        start = end
+    if start < len(text) or not chunks:
+        chunks.append(text[start:])
+    return chunks
+
+
+def text_parts(name: str, text: str, max_chars_per_part: int = 100_000):
+    """
+    Wrap a text attachment as one or more labelled text blocks.
+
+    Each block names the file (and its position when the file is split) so
+    the model can tell attachments and chunks apart.
+    """
+    chunks = chunk_text(text, max_chars_per_part)
+    parts = []
+    for index, chunk in enumerate(chunks, 1):
+        label = f"{name} (part {index}/{len(chunks)})" if len(chunks) > 1 else name
+        parts.append(f"[Attached file: {label}]\n```\n{chunk}\n```")
+    return parts
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# What to do when some attachments of a message fail to upload
+POLICY_ABORT = "abort"                # fail the whole turn (the old behaviour)
+POLICY_CONTINUE = "continue"          # go ahead with whatever uploaded, even nothing
+POLICY_REQUIRE_ONE = "require_one"    # go ahead if at least one file uploaded
+FAILURE_POLICIES = (POLICY_ABORT, POLICY_CONTINUE, POLICY_REQUIRE_ONE)
+
+
+class UploadError(Exception):
+    """Raised by upload_all() when the failure policy does not allow the turn to go on."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        names = ", ".join(f"{name} ({error})" for name, error in failures)
+        super().__init__(f"Failed to upload: {names}")
+
+
+def upload_all(files, upload_one, max_workers: int = 4, policy: str = POLICY_CONTINUE,
+               on_status=None, cancel_token=None):
+    """
+    Upload `files` concurrently and return (uploaded, failures).
+
+    `upload_one(file_info)` does one upload and returns the uploaded object;
+    at most `max_workers` run at once, so a message takes about as long as
+    its slowest file. `on_status(name, status, error)` is called with
+    "uploading", "success" or "error" as each file progresses. `uploaded`
+    keeps the order of `files`; `failures` is a list of (name, message).
+
+    Files not yet started when `cancel_token` is cancelled are skipped and
+    the cancellation is raised once the running uploads have finished.
+    Raises UploadError if `policy` rejects the outcome.
+    """
+    if policy not in FAILURE_POLICIES:
+        raise ValueError(f"Unknown upload failure policy: {policy}")
+
+    def _run(file_info):
+        if cancel_token is not None and cancel_token.cancelled:
+            return None, None
+        name = file_info.get("name", "")
+        if on_status:
+            on_status(name, "uploading", None)
+        try:
+            result = upload_one(file_info)
+        except Exception as e:
+            if on_status:
+                on_status(name, "error", str(e))
+            return None, (name, str(e))
+        if on_status:
+            on_status(name, "success", None)
+        return result, None
+
+    files = list(files)
+    if not files:
+        return [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files))),
+                            thread_name_prefix="upload") as pool:
+        outcomes = list(pool.map(_run, files))
+    if cancel_token is not None:
+        cancel_token.check()
+
+    uploaded = [result for result, failure in outcomes if failure is None and result is not None]
+    failures = [failure for _, failure in outcomes if failure is not None]
+    if failures and (policy == POLICY_ABORT or (policy == POLICY_REQUIRE_ONE and not uploaded)):
+        raise UploadError(failures)
+    return uploaded, failures
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Sequence
+
+from modules import storage
+
+
+class InteractionWriter:
+    """
+    Persists chat messages on a background thread.
+
+    Turns are queued with submit() and written by a single writer thread, so
+    they land in the database in submission order. Rows that arrive within
+    `group_commit_delay` of each other share one transaction. The queue is
+    bounded: if the disk stalls, submit() blocks instead of growing memory.
+    Call flush() before reading history or exiting the process.
+
+    A batch that cannot be written is never dropped: the writer keeps it
+    and retries with backoff (up to `max_backoff` seconds apart) until it
+    succeeds. Meanwhile `failing` is True, `last_error` holds the error and
+    flush() returns False.
+    """
+
+    def __init__(self, max_pending: int = 256, batch_size: int = 64,
+                 group_commit_delay: float = 0.05, max_retries: int = 3, max_backoff: float = 5.0):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._batch_size = batch_size
+        self._group_commit_delay = group_commit_delay
+        self._max_retries = max_retries
+        self._max_backoff = max_backoff
+        # Batches taken off the queue but not yet written (inline drain failed)
+        self._held = []
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.last_error = None
+        self.failing = False
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="interaction-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, rows: Iterable[Sequence]):
+        """Queue (role, parts[, timestamp]) rows; timestamps default to submit time."""
+        self.start()
+        stamped = []
+        for row in rows:
+            timestamp = row[2] if len(row) > 2 and row[2] else datetime.now().isoformat()
+            stamped.append((row[0], row[1], timestamp))
+        if stamped:
+            self._queue.put(stamped)
+
+    def pending(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Block until every queued row is on disk. False if rows are still
+        unwritten: `timeout` expired, or writes are failing (no point waiting).
+        """
+        if self._thread is None or not self._thread.is_alive():
+            # Nothing can drain the queue (never started or crashed): write inline
+            self._drain_inline()
+            return self._queue.unfinished_tasks == 0
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.failing:
+                    return False
+                self._queue.all_tasks_done.wait(min(remaining, 0.5))
+        return True
+
+    def _collect(self, first):
+        batches = [first]
+        rows = len(first)
+        deadline = time.monotonic() + self._group_commit_delay
+        while rows < self._batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batches.append(batch)
+            rows += len(batch)
+        return batches
+
+    def _write(self, batches) -> bool:
+        """Try to insert the rows a few times; True once they are committed."""
+        rows = [row for batch in batches for row in batch]
+        for attempt in range(self._max_retries):
+            try:
+                storage.insert_interactions(rows)
+                self.last_error = None
+                self.failing = False
+                return True
+            except Exception as e:
+                # Usually a transient lock held by another connection
+                self.last_error = e
+                time.sleep(0.1 * (attempt + 1))
+        self.failing = True
+        return False
+
+    def _run(self):
+        while True:
+            if self._held:
+                batches, self._held = self._held, []
+            else:
+                batches = self._collect(self._queue.get())
+            backoff = 0.5
+            # Keep the batch until it is written; the rows are the user's turns
+            while not self._write(batches):
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+            for _ in batches:
+                self._queue.task_done()
+
+    def _drain_inline(self):
+        while True:
+            if self._held:
+                batch = self._held.pop(0)
+            else:
+                try:
+                    batch = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+            if not self._write([batch]):
+                # Keep it (and everything after it, in order) for the next attempt
+                self._held.insert(0, batch)
+                return
+            self._queue.task_done()
@@ -8,6 +8,8 @@ SPLASH_PATH = os.path.join(FRONTEND_DIR, 'splash.html')
 # Global variables to store window and api references
 splash_window = None
 splash_api = None
+# Callables run right before the process exits (e.g. flushing pending database writes)
+shutdown_hooks = []
 class SplashApi:
     def __init__(self, window):
         self.window = window
@@ -52,9 +54,18 @@ def start_splash(func=None):
     """Start the webview - must be called on main thread"""
     webview.start(func, gui='edgechromium')
 
+def run_shutdown_hooks():
+    """Run every registered shutdown hook; a failing hook never blocks the exit"""
+    for hook in shutdown_hooks:
+        try:
+            hook()
+        except Exception:
+            pass
+
 def close_application():
     """Properly close the webview application"""
     # print'Closing application...')
+    run_shutdown_hooks()
     
     try:
         # Close splash window if it exists
@@ -85,6 +96,7 @@ def close_application():
 def force_close_application():
     """Force close application immediately"""
     # print'Force closing application...')
+    run_shutdown_hooks()
     
     try:
         # Try to close windows gracefully first
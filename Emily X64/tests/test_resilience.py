@@ -0,0 +1,238 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.request_executor import CancelToken, RequestCancelled
+from modules.resilience import (CallTimeout, CircuitBreaker, CircuitOpenError, LatencyTracker, ResilientCaller,
+                                RetryBudget, is_transient)
+
+
+class APIError(Exception):
+    """Stands in for google.genai.errors.APIError, which carries the HTTP status as `code`."""
+
+    def __init__(self, code):
+        self.code = code
+        super().__init__(f"{code} error")
+
+
+class FakeStream:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """
+    A local stand-in for the genai client.
+
+    `script` lists what successive calls do: a number is a latency in
+    seconds, an exception is raised after a short delay.
+    """
+
+    def __init__(self, script=(), default=0.01):
+        self.script = list(script)
+        self.default = default
+        self.calls = 0
+        self.streams = []
+        self.lock = threading.Lock()
+
+    def _next(self):
+        with self.lock:
+            self.calls += 1
+            return self.script.pop(0) if self.script else self.default
+
+    def generate_content(self, contents):
+        step = self._next()
+        if isinstance(step, BaseException):
+            time.sleep(0.005)
+            raise step
+        time.sleep(step)
+        return f"reply to {contents}"
+
+    def open_stream(self):
+        step = self._next()
+        time.sleep(step)
+        stream = FakeStream()
+        with self.lock:
+            self.streams.append(stream)
+        return stream
+
+
+def make_caller(**overrides):
+    options = dict(timeout=2.0, base_delay=0.001, max_delay=0.01, hedge_min_delay=0.02, latency_min_samples=5,
+                   budget=RetryBudget(max_tokens=20))
+    options.update(overrides)
+    return ResilientCaller(**options)
+
+
+class RetryTests(unittest.TestCase):
+    def test_transient_errors_are_retried(self):
+        client = FakeClient([APIError(503), APIError(429)])
+        caller = make_caller()
+        self.assertEqual(caller.call(client.generate_content, "hi"), "reply to hi")
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(caller.stats["retries"], 2)
+
+    def test_request_errors_are_not_retried(self):
+        client = FakeClient([APIError(400)])
+        caller = make_caller()
+        with self.assertRaises(APIError):
+            caller.call(client.generate_content, "hi")
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(caller.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_attempts_are_capped(self):
+        client = FakeClient([APIError(500)] * 10)
+        caller = make_caller(max_attempts=3)
+        with self.assertRaises(APIError):
+            caller.call(client.generate_content, "hi")
+        self.assertEqual(client.calls, 3)
+
+    def test_retry_budget_limits_extra_load(self):
+        client = FakeClient([APIError(503)] * 100)
+        caller = make_caller(budget=RetryBudget(ratio=0.1, refill_per_second=0, max_tokens=2),
+                             breaker=CircuitBreaker(failure_threshold=1000))
+        for _ in range(10):
+            with self.assertRaises(APIError):
+                caller.call(client.generate_content, "hi")
+        # 10 first attempts plus the 2 banked tokens; the 0.1 deposited by each
+        # later call never adds up to another retry
+        self.assertEqual(client.calls, 12)
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient(APIError(429)))
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertTrue(is_transient(CallTimeout()))
+        self.assertFalse(is_transient(APIError(404)))
+        self.assertFalse(is_transient(ValueError()))
+
+
+class TimeoutTests(unittest.TestCase):
+    def test_stateful_call_is_not_retried_after_timeout(self):
+        client = FakeClient([0.5])
+        caller = make_caller(timeout=0.1)
+        with self.assertRaises(CallTimeout):
+            caller.call(client.generate_content, "hi")
+        self.assertEqual(client.calls, 1)
+
+    def test_idempotent_call_is_retried_after_timeout(self):
+        client = FakeClient([0.5, 0.01])
+        caller = make_caller(timeout=0.1)
+        self.assertEqual(caller.call(client.generate_content, "hi", idempotent=True), "reply to hi")
+        self.assertEqual(caller.stats["timeouts"], 1)
+
+    def test_abandoned_attempt_is_discarded(self):
+        client = FakeClient([0.3])
+        caller = make_caller(timeout=0.1)
+        with self.assertRaises(CallTimeout):
+            caller.call(client.open_stream, on_discard=lambda stream: stream.close())
+        time.sleep(0.4)
+        self.assertEqual(len(client.streams), 1)
+        self.assertTrue(client.streams[0].closed)
+
+    def test_cancel_stops_waiting(self):
+        client = FakeClient([1.0])
+        caller = make_caller()
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(RequestCancelled):
+            caller.call(client.generate_content, "hi", cancel_token=token)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+
+class HedgingTests(unittest.TestCase):
+    def warm(self, caller, client, kind="gen"):
+        for _ in range(5):
+            caller.call(client.generate_content, "warm", kind=kind, idempotent=True)
+
+    def test_slow_idempotent_call_is_hedged(self):
+        client = FakeClient(default=0.01)
+        caller = make_caller()
+        self.warm(caller, client)
+        client.script = [1.0, 0.01]
+        started = time.monotonic()
+        self.assertEqual(caller.call(client.generate_content, "hi", kind="gen", idempotent=True), "reply to hi")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(caller.stats["hedges"], 1)
+        self.assertEqual(caller.stats["hedge_wins"], 1)
+
+    def test_losing_hedge_is_discarded(self):
+        client = FakeClient(default=0.01)
+        caller = make_caller()
+        for _ in range(5):
+            caller.call(client.open_stream, kind="stream", idempotent=True)
+        client.script = [0.3, 0.01]
+        winner = caller.call(client.open_stream, kind="stream", idempotent=True, on_discard=lambda s: s.close())
+        time.sleep(0.4)
+        self.assertFalse(winner.closed)
+        losers = [stream for stream in client.streams[5:] if stream is not winner]
+        self.assertEqual(len(losers), 1)
+        self.assertTrue(losers[0].closed)
+
+    def test_stateful_call_is_never_hedged(self):
+        client = FakeClient(default=0.01)
+        caller = make_caller()
+        for _ in range(5):
+            caller.call(client.generate_content, "warm", kind="chat")
+        client.script = [0.2]
+        caller.call(client.generate_content, "hi", kind="chat")
+        self.assertEqual(client.calls, 6)
+        self.assertEqual(caller.stats["hedges"], 0)
+
+    def test_latency_quantile(self):
+        tracker = LatencyTracker(window=100, min_samples=10)
+        for ms in range(1, 10):
+            tracker.record(ms / 1000)
+        self.assertIsNone(tracker.quantile(0.95))
+        tracker.record(0.5)
+        self.assertEqual(tracker.quantile(0.95), 0.5)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_fails_fast_and_recovers(self):
+        states = []
+        client = FakeClient([APIError(503)] * 5)
+        caller = make_caller(max_attempts=1,
+                             breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.2, on_state_change=states.append))
+        for _ in range(5):
+            with self.assertRaises(APIError):
+                caller.call(client.generate_content, "hi")
+        with self.assertRaises(CircuitOpenError) as raised:
+            caller.call(client.generate_content, "hi")
+        self.assertIn("try again", str(raised.exception))
+        self.assertEqual(client.calls, 5)
+        time.sleep(0.25)
+        self.assertEqual(caller.call(client.generate_content, "hi"), "reply to hi")
+        self.assertEqual(states, [CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN, CircuitBreaker.CLOSED])
+
+    def test_failed_probe_reopens(self):
+        clock = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        clock[0] = 11
+        breaker.before_call()
+        # Only one probe at a time
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_cancelled_probe_lets_the_next_call_probe(self):
+        clock = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+        breaker.record_failure()
+        clock[0] = 11
+        breaker.before_call()
+        breaker.release()
+        breaker.before_call()
+
+
+if __name__ == "__main__":
+    unittest.main()